@@ -1,106 +1,164 @@
 import os
-import requests
 import json
-from msal import ConfidentialClientApplication
+import asyncio
 from dotenv import load_dotenv
+from graph_client import MEMBER_OF_PARAMS, request, run, list_all
+from directory_cache import MISSING, user_ids, managers, memberships, cached, forget_user
 from email_notify import send_email, render_template
 from notifier import notify_all
+from metrics import timed
+from lockout import lock_out_user
+from tenants import setting
 
 load_dotenv()
 
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://graph.microsoft.com/.default"]
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-with open("config.json") as f:
+with open(os.path.join(BASE_DIR, "config.json")) as f:
     CONFIG = json.load(f)
 
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
-
-token = app.acquire_token_for_client(scopes=SCOPE)
-if "access_token" not in token:
-    raise Exception("Authentication failed.")
-
-headers = {
-    "Authorization": f"Bearer {token['access_token']}",
-    "Content-Type": "application/json"
-}
-
-def get_user_id(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}"
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    return r.json()["id"]
-
-def disable_user(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}"
+# === Async Steps ===
+@timed("get_user_id")
+async def get_user_id_async(upn):
+    async def load():
+        r = await request("GET", f"/users/{upn}?$select=id")
+        r.raise_for_status()
+        return r.json()["id"]
+    return await cached(user_ids, upn, load)
+
+@timed("disable_user")
+async def disable_user_async(upn):
     data = {
         "accountEnabled": False
     }
-    r = requests.patch(url, headers=headers, json=data)
+    r = await request("PATCH", f"/users/{upn}", json=data)
     r.raise_for_status()
 
-def remove_licenses(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}/assignLicense"
+@timed("revoke_sessions")
+async def revoke_sessions_async(upn):
+    # Invalidates refresh tokens and session cookies, so a disabled account
+    # cannot keep using sessions it already has.
+    r = await request("POST", f"/users/{upn}/revokeSignInSessions")
+    r.raise_for_status()
+
+@timed("remove_licenses")
+async def remove_licenses_async(upn):
     data = {
         "addLicenses": [],
-        "removeLicenses": [CONFIG["license_sku_id"]]
+        "removeLicenses": [setting("license_sku_id")]
     }
-    r = requests.post(url, headers=headers, json=data)
-    r.raise_for_status()
-
-def remove_from_all_groups(user_id):
-    url = f"https://graph.microsoft.com/v1.0/users/{user_id}/memberOf"
-    r = requests.get(url, headers=headers)
+    r = await request("POST", f"/users/{upn}/assignLicense", json=data)
     r.raise_for_status()
-    groups = r.json()["value"]
 
-    for group in groups:
-        if group["@odata.type"] == "#microsoft.graph.group":
-            group_id = group["id"]
-            delete_url = f"https://graph.microsoft.com/v1.0/groups/{group_id}/members/{user_id}/$ref"
-            del_req = requests.delete(delete_url, headers=headers)
-            del_req.raise_for_status()
+async def remove_from_group_async(group_id, user_id):
+    r = await request("DELETE", f"/groups/{group_id}/members/{user_id}/$ref")
+    if r.status_code != 404:
+        r.raise_for_status()
+
+async def get_member_of_async(user_id):
+    # Cast to groups server-side and only fetch ids; every page is read so users
+    # in more than one page of groups are fully offboarded.
+    async def load():
+        groups = await list_all(f"/users/{user_id}/memberOf/microsoft.graph.group", MEMBER_OF_PARAMS)
+        return [group["id"] for group in groups]
+    return await cached(memberships, user_id, load)
+
+@timed("remove_from_all_groups")
+async def remove_from_all_groups_async(user_id):
+    group_ids = await get_member_of_async(user_id)
+    try:
+        # Fanned out together; the tenant limiter in graph_client caps how many run at once.
+        await asyncio.gather(*(remove_from_group_async(group_id, user_id) for group_id in group_ids))
+    finally:
+        forget_user(user_id=user_id)
+
+@timed("get_user_manager")
+async def get_user_manager_async(upn):
+    manager = managers.get(upn)
+    if manager is MISSING:
+        r = await request("GET", f"/users/{upn}/manager")
+        if r.status_code not in (200, 404):
+            # Transient failure: report no manager but don't cache it.
+            return None
+        manager = r.json().get("mail") if r.status_code == 200 else None
+        managers.set(upn, manager)
+    return manager
+
+async def remove_user_from_groups_async(upn):
+    # Deprovisioning never trusts a cached id: after a rehire it would be the
+    # deleted account's, and the live account would keep its groups.
+    user_ids.invalidate(upn)
+    user_id = await get_user_id_async(upn)
+    await remove_from_all_groups_async(user_id)
+
+async def lock_out_async(upn):
+    # Blocks new sign-ins and ends existing sessions, side by side.
+    await asyncio.gather(disable_user_async(upn), revoke_sessions_async(upn))
+
+async def clean_up_user_async(upn):
+    _, _, manager_email = await asyncio.gather(
+        remove_licenses_async(upn),
+        remove_user_from_groups_async(upn),
+        get_user_manager_async(upn)
+    )
+    return manager_email
+
+async def deprovision_user_async(upn):
+    await lock_out_async(upn)
+    return await clean_up_user_async(upn)
+
+# === Sync Wrappers ===
+def get_user_id(upn):
+    return run(get_user_id_async(upn))
 
-def get_user_manager(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}/manager"
-    r = requests.get(url, headers=headers)
-    if r.status_code == 200:
-        return r.json().get("mail")
-    return None
+def disable_user(upn):
+    run(disable_user_async(upn))
 
-if __name__ == "__main__":
-    upn = input("Enter user's UPN (e.g. jdoe@example.com): ")
+def remove_licenses(upn):
+    run(remove_licenses_async(upn))
 
-    print("Disabling account...")
-    disable_user(upn)
+def remove_from_all_groups(user_id):
+    run(remove_from_all_groups_async(user_id))
 
-    print("Removing licenses...")
-    remove_licenses(upn)
+def get_user_manager(upn):
+    return run(get_user_manager_async(upn))
 
-    print("Removing from groups...")
-    user_id = get_user_id(upn)
-    remove_from_all_groups(user_id)
+def lock_out(upn):
+    run(lock_out_async(upn))
 
+def send_exit_notices(upn, manager_email):
     print("Sending exit email...")
-    html = render_template("templates/exit_email.html", {
+    html = render_template(os.path.join(BASE_DIR, "templates", "exit_email.html"), {
         "upn": upn,
         "logo_url": CONFIG["logo_url"]
     })
 
     send_email("it-team@example.com", f"User {upn} Offboarded", html)
 
-    manager_email = get_user_manager(upn)
     if manager_email:
         send_email(manager_email, f"{upn} offboarded", html)
 
     print("Notifying Slack/Teams...")
     notify_all(f"⚠️ User offboarded: *{upn}*")
 
+def clean_up_user(upn):
+    # The deferred half of a lock-out: licenses, groups, emails, notifications.
+    manager_email = run(clean_up_user_async(upn))
+    send_exit_notices(upn, manager_email)
+
+def offboard_user(upn):
+    print("Disabling account, revoking sessions, removing licenses and groups...")
+    manager_email = run(deprovision_user_async(upn))
+    send_exit_notices(upn, manager_email)
     print("✅ Offboarding complete.")
+
+def main():
+    upn = input("Enter user's UPN (e.g. jdoe@example.com): ")
+    # Sign-in is blocked first; cleanup finishes in the background before exit.
+    outcomes, _ = lock_out_user(upn, ["azure"])
+    failed = {name: outcome for name, outcome in outcomes.items() if not outcome["success"]}
+    if failed:
+        raise Exception("; ".join(f"{name}: {outcome['error']}" for name, outcome in failed.items()))
+
+if __name__ == "__main__":
+    main()
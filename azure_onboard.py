@@ -1,39 +1,24 @@
 import os
 import json
-import requests
-from msal import ConfidentialClientApplication
+import asyncio
 from dotenv import load_dotenv
+from graph_client import GRAPH_URL, request, run
+from directory_cache import MISSING, user_ids, managers, forget_user
 from email_notify import send_email, render_template
 from notifier import notify_all
+from metrics import timed
+from tenants import setting
 
 load_dotenv()
 
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://graph.microsoft.com/.default"]
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-with open("config.json") as f:
+with open(os.path.join(BASE_DIR, "config.json")) as f:
     CONFIG = json.load(f)
 
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
-
-token = app.acquire_token_for_client(scopes=SCOPE)
-if "access_token" not in token:
-    raise Exception("Authentication failed.")
-
-headers = {
-    "Authorization": f"Bearer {token['access_token']}",
-    "Content-Type": "application/json"
-}
-
-def create_user(display_name, user_principal_name, mail_nickname):
-    url = "https://graph.microsoft.com/v1.0/users"
+# === Async Steps ===
+@timed("create_user")
+async def create_user_async(display_name, user_principal_name, mail_nickname):
     data = {
         "accountEnabled": True,
         "displayName": display_name,
@@ -41,69 +26,93 @@ def create_user(display_name, user_principal_name, mail_nickname):
         "userPrincipalName": user_principal_name,
         "passwordProfile": {
             "forceChangePasswordNextSignIn": True,
-            "password": CONFIG["default_password"]
+            "password": setting("default_password")
         }
     }
-    response = requests.post(url, headers=headers, json=data)
+    response = await request("POST", "/users", json=data)
     response.raise_for_status()
-    return response.json()["id"]
+    user_id = response.json()["id"]
+    user_ids.set(user_principal_name, user_id)
+    return user_id
 
-def add_user_to_groups(user_id):
-    for group_id in CONFIG["groups"]:
-        url = f"https://graph.microsoft.com/v1.0/groups/{group_id}/members/$ref"
-        data = {
-            "@odata.id": f"https://graph.microsoft.com/v1.0/directoryObjects/{user_id}"
-        }
-        r = requests.post(url, headers=headers, json=data)
-        r.raise_for_status()
+async def add_to_group_async(group_id, user_id):
+    data = {
+        "@odata.id": f"{GRAPH_URL}/directoryObjects/{user_id}"
+    }
+    r = await request("POST", f"/groups/{group_id}/members/$ref", json=data)
+    r.raise_for_status()
 
-def assign_license(user_id):
-    url = f"https://graph.microsoft.com/v1.0/users/{user_id}/assignLicense"
+@timed("add_user_to_groups")
+async def add_user_to_groups_async(user_id):
+    try:
+        await asyncio.gather(*(add_to_group_async(group_id, user_id) for group_id in setting("groups")))
+    finally:
+        forget_user(user_id=user_id)
+
+@timed("assign_license")
+async def assign_license_async(user_id):
     data = {
         "addLicenses": [
             {
-                "skuId": CONFIG["license_sku_id"]
+                "skuId": setting("license_sku_id")
             }
         ],
         "removeLicenses": []
     }
-    r = requests.post(url, headers=headers, json=data)
+    r = await request("POST", f"/users/{user_id}/assignLicense", json=data)
     r.raise_for_status()
 
+@timed("get_user_manager")
+async def get_user_manager_async(upn):
+    manager = managers.get(upn)
+    if manager is MISSING:
+        r = await request("GET", f"/users/{upn}/manager")
+        if r.status_code not in (200, 404):
+            # Transient failure: report no manager but don't cache it.
+            return None
+        manager = r.json().get("mail") if r.status_code == 200 else None
+        managers.set(upn, manager)
+    return manager
+
+async def provision_user_async(display_name, user_principal_name, mail_nickname):
+    user_id = await create_user_async(display_name, user_principal_name, mail_nickname)
+    _, _, manager_email = await asyncio.gather(
+        add_user_to_groups_async(user_id),
+        assign_license_async(user_id),
+        get_user_manager_async(user_principal_name)
+    )
+    return user_id, manager_email
+
+# === Sync Wrappers ===
+def create_user(display_name, user_principal_name, mail_nickname):
+    return run(create_user_async(display_name, user_principal_name, mail_nickname))
+
+def add_user_to_groups(user_id):
+    run(add_user_to_groups_async(user_id))
+
+def assign_license(user_id):
+    run(assign_license_async(user_id))
+
 def get_user_manager(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}/manager"
-    r = requests.get(url, headers=headers)
-    if r.status_code == 200:
-        return r.json().get("mail")
-    return None
+    return run(get_user_manager_async(upn))
 
-if __name__ == "__main__":
-    display_name = os.getenv("ONBOARD_NAME") or input("Enter full name: ")
-    username = os.getenv("ONBOARD_USERNAME") or input("Enter username (without domain): ")
-    domain = os.getenv("ONBOARD_DOMAIN") or input("Enter domain (e.g. example.com): ")
+def onboard_user(display_name, username, domain):
     user_principal_name = f"{username}@{domain}"
 
-    print("Creating user...")
-    user_id = create_user(display_name, user_principal_name, username)
+    print("Creating user, adding to groups and assigning license...")
+    user_id, manager_email = run(provision_user_async(display_name, user_principal_name, username))
     print(f"User created: {user_id}")
 
-    print("Adding to groups...")
-    add_user_to_groups(user_id)
-
-    print("Assigning license...")
-    assign_license(user_id)
-
     print("Sending welcome email to user...")
-    html = render_template("templates/welcome_email.html", {
+    html = render_template(os.path.join(BASE_DIR, "templates", "welcome_email.html"), {
         "name": display_name,
         "upn": user_principal_name,
-        "password": CONFIG["default_password"],
+        "password": setting("default_password"),
         "logo_url": CONFIG["logo_url"]
     })
     send_email(user_principal_name, "Welcome to the Team!", html)
 
     print("Notifying manager...")
-    manager_email = get_user_manager(user_principal_name)
     if manager_email:
         send_email(manager_email, f"{display_name} has joined your team", html)
 
@@ -111,3 +120,13 @@ if __name__ == "__main__":
     notify_all(f"✅ User onboarded: *{display_name}* ({user_principal_name})")
 
     print("✅ Onboarding complete.")
+    return user_id
+
+def main():
+    display_name = os.getenv("ONBOARD_NAME") or input("Enter full name: ")
+    username = os.getenv("ONBOARD_USERNAME") or input("Enter username (without domain): ")
+    domain = os.getenv("ONBOARD_DOMAIN") or input("Enter domain (e.g. example.com): ")
+    onboard_user(display_name, username, domain)
+
+if __name__ == "__main__":
+    main()
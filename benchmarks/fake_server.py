@@ -0,0 +1,346 @@
+"""Local stand-in for Microsoft Graph, the Google Directory API and Slack/Teams webhooks.
+
+Emulates only the endpoints this kit calls, with configurable latency, 429
+injection and memberOf pagination, and counts every HTTP call it serves:
+
+    python benchmarks/fake_server.py --port 8765 --latency 20 --throttle 0.02
+
+    GRAPH_BASE_URL=http://127.0.0.1:8765/v1.0
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8765/
+    SLACK_WEBHOOK=http://127.0.0.1:8765/webhook/slack
+    TEAMS_WEBHOOK=http://127.0.0.1:8765/webhook/teams
+
+GET /_stats returns the counters as JSON and POST /_reset clears them.
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict
+from email.parser import Parser
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GRAPH_PREFIX = "/v1.0"
+GOOGLE_PREFIX = "/admin/directory/v1"
+
+# === State ===
+class FakeState:
+    def __init__(self, latency=0.0, jitter=0.0, throttle=0.0, retry_after="0.05", page_size=100, groups_per_user=5):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.groups_per_user = groups_per_user
+        self.lock = threading.Lock()
+        # Directory state outlives /_reset, so a later scenario sees what an earlier one created.
+        self.users = set()
+        self.disabled = set()
+        self.names = {}
+        self.licenses = defaultdict(set)
+        self.members = defaultdict(set)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stats = Counter()
+
+    def count(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def throttled(self):
+        return self.throttle and random.random() < self.throttle
+
+    def wait(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def create(self, key):
+        # Returns False if the user already exists.
+        with self.lock:
+            if key.lower() in self.users:
+                return False
+            self.users.add(key.lower())
+            return True
+
+    def add_member(self, group, member):
+        # Returns False if the member was already in the group.
+        with self.lock:
+            if member in self.members[group]:
+                return False
+            self.members[group].add(member)
+            return True
+
+def user_id(key):
+    # Every user "exists" with a stable id, so offboarding works on a fresh server.
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key.lower()))
+
+def object_id(key):
+    # Paths address users by UPN or by object id.
+    return user_id(key) if "@" in key else key
+
+def user_resource(state, upn):
+    key = user_id(upn)
+    return {"id": key, "userPrincipalName": upn, "displayName": state.names.get(key),
+            "accountEnabled": key not in state.disabled,
+            "assignedLicenses": [{"skuId": sku} for sku in sorted(state.licenses[key])]}
+
+def filtered_users(state, query):
+    # Only "userPrincipalName in ('a', 'b')" is understood; only created users match.
+    expression = query.get("$filter", [""])[0]
+    upns = [value.replace("''", "'") for value in re.findall(r"'((?:[^']|'')*)'", expression)]
+    return {"value": [user_resource(state, upn) for upn in upns if upn.lower() in state.users]}
+
+def error(status, message):
+    return status, {"error": {"code": str(status), "message": message}}
+
+# === Graph ===
+def graph(state, method, path, query, body, base_url):
+    route = re.sub(r"/(users|groups|members)/[^/]+", r"/\1/{id}", path)
+    state.count(f"graph {method} {route}")
+    if state.throttled():
+        state.count("throttled")
+        return 429, {"error": {"code": "TooManyRequests", "message": "Throttled"}}, {"Retry-After": state.retry_after}
+
+    parts = [unquote(part) for part in path.strip("/").split("/")]
+    if parts == ["users"] and method == "POST":
+        upn = body["userPrincipalName"]
+        if not state.create(upn):
+            return (*error(400, "Another object with the same value for property userPrincipalName already exists."), {})
+        state.names[user_id(upn)] = body.get("displayName")
+        return 201, {"id": user_id(upn), "userPrincipalName": upn}, {}
+    if parts == ["users"] and method == "GET":
+        return 200, filtered_users(state, query), {}
+    if parts[0] == "users" and len(parts) == 2:
+        if method == "GET":
+            return 200, {"id": object_id(parts[1]), "userPrincipalName": parts[1], "accountEnabled": True}, {}
+        if method == "PATCH" and "accountEnabled" in (body or {}):
+            with state.lock:
+                (state.disabled.discard if body["accountEnabled"] else state.disabled.add)(object_id(parts[1]))
+        if method == "PATCH" and "displayName" in (body or {}):
+            state.names[object_id(parts[1])] = body["displayName"]
+        return 204, None, {}
+    if parts[0] == "users" and len(parts) >= 3:
+        action = parts[2]
+        if action == "manager":
+            return 200, {"mail": "manager@example.com"}, {}
+        if action == "memberOf":
+            return 200, member_of_page(state, parts[1], query, base_url), {}
+        if action == "sendMail":
+            return 202, None, {}
+        if action == "revokeSignInSessions":
+            return 200, {"value": True}, {}
+        if action == "assignLicense":
+            with state.lock:
+                state.licenses[object_id(parts[1])].update(item["skuId"] for item in body.get("addLicenses", []))
+                state.licenses[object_id(parts[1])].difference_update(body.get("removeLicenses", []))
+            return 200, {"id": object_id(parts[1])}, {}
+    if parts[0] == "groups" and parts[2:] == ["members", "$ref"] and method == "POST":
+        if not state.add_member(parts[1], body["@odata.id"].rsplit("/", 1)[-1]):
+            return (*error(400, "One or more added object references already exist for the following modified "
+                                "properties: 'members'."), {})
+        return 204, None, {}
+    if parts[0] == "groups" and len(parts) == 2 and method == "PATCH" and "members@odata.bind" in body:
+        # All or nothing, like Graph: one existing member fails the whole PATCH.
+        members = [link.rsplit("/", 1)[-1] for link in body["members@odata.bind"]]
+        with state.lock:
+            if state.members[parts[1]].intersection(members):
+                return (*error(400, "One or more added object references already exist for the following "
+                                    "modified properties: 'members'."), {})
+            state.members[parts[1]].update(members)
+        return 204, None, {}
+    if parts[0] == "groups" and parts[2:3] == ["members"] and method == "GET":
+        return 200, members_page(state, parts[1], query, base_url), {}
+    if parts[0] == "groups" and parts[2:3] == ["members"] and method == "DELETE":
+        with state.lock:
+            state.members[parts[1]].discard(parts[3])
+        return 204, None, {}
+    if parts[0] == "groups":
+        return 204, None, {}
+    return (*error(404, f"No route for {method} {path}"), {})
+
+def member_of_page(state, key, query, base_url):
+    # Every user is in groups_per_user placeholder groups, plus any group they were added to.
+    top = min(int(query.get("$top", ["100"])[0]), state.page_size)
+    start = int(query.get("$skiptoken", ["0"])[0])
+    with state.lock:
+        joined = sorted(group for group, members in state.members.items() if object_id(key) in members)
+    groups = [f"group-{n}" for n in range(state.groups_per_user)] + joined
+    end = min(start + top, len(groups))
+    page = {"value": [{"@odata.type": "#microsoft.graph.group", "id": group} for group in groups[start:end]]}
+    if end < len(groups):
+        page["@odata.nextLink"] = f"{base_url}{GRAPH_PREFIX}/users/{key}/memberOf/microsoft.graph.group?$top={top}&$skiptoken={end}"
+    return page
+
+def members_page(state, group, query, base_url):
+    top = min(int(query.get("$top", ["100"])[0]), state.page_size)
+    start = int(query.get("$skiptoken", ["0"])[0])
+    with state.lock:
+        members = sorted(state.members[group])
+    page = {"value": [{"@odata.type": "#microsoft.graph.user", "id": member} for member in members[start:start + top]]}
+    if start + top < len(members):
+        page["@odata.nextLink"] = (f"{base_url}{GRAPH_PREFIX}/groups/{group}/members/microsoft.graph.user"
+                                   f"?$select=id&$top={top}&$skiptoken={start + top}")
+    return page
+
+def graph_batch(state, body, base_url):
+    state.count("graph $batch")
+    responses, status_by_id = [], {}
+    for item in body["requests"]:
+        state.count("sub_requests")
+        if any(status_by_id.get(dep, 500) >= 400 for dep in item.get("dependsOn", [])):
+            status, payload, headers = 424, {"error": {"code": "FailedDependency", "message": "Dependency failed"}}, {}
+        else:
+            split = urlsplit(item["url"])
+            status, payload, headers = graph(state, item["method"], split.path, parse_qs(split.query),
+                                             item.get("body"), base_url)
+        status_by_id[item["id"]] = status
+        responses.append({"id": item["id"], "status": status, "headers": headers, "body": payload})
+    return {"responses": responses}
+
+# === Google Directory ===
+def google(state, method, path, body):
+    route = re.sub(r"/(users|groups|members)/[^/]+", r"/\1/{key}", path[len(GOOGLE_PREFIX):])
+    state.count(f"google {method} {route}")
+    if state.throttled():
+        state.count("throttled")
+        return 429, {"error": {"code": 429, "message": "Rate limit exceeded",
+                               "errors": [{"reason": "rateLimitExceeded"}]}}
+    parts = [unquote(part) for part in path[len(GOOGLE_PREFIX):].strip("/").split("/")]
+    if parts == ["users"] and method == "POST":
+        if not state.create(body["primaryEmail"]):
+            return 409, {"error": {"code": 409, "message": "Entity already exists."}}
+        return 200, dict(body, id=user_id(body["primaryEmail"]))
+    if parts[0] == "users" and len(parts) == 2:
+        return 200, dict(body or {}, primaryEmail=parts[1], id=user_id(parts[1]))
+    if parts == ["groups"] and method == "GET":
+        return 200, {"groups": [{"email": f"group-{n}@example.com"} for n in range(state.groups_per_user)]}
+    if parts[0] == "groups" and parts[2:] == ["members"]:
+        return 200, dict(body or {}, kind="admin#directory#member")
+    if parts[0] == "groups" and parts[2:3] == ["members"] and method == "DELETE":
+        return 204, None
+    return 404, {"error": {"code": 404, "message": f"No route for {method} {path}"}}
+
+def google_batch(state, content_type, raw):
+    # multipart/mixed in, multipart/mixed out; each part is one application/http request.
+    state.count("google batch")
+    message = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{raw}")
+    boundary = f"batch_{uuid.uuid4().hex}"
+    out = []
+    for part in message.get_payload():
+        state.count("sub_requests")
+        head, _, body = part.get_payload().replace("\r\n", "\n").partition("\n\n")
+        method, target, _ = head.split("\n", 1)[0].strip().split(" ", 2)
+        body = body.strip()
+        status, payload = google(state, method, urlsplit(target).path, json.loads(body) if body else None)
+        data = json.dumps(payload) if payload is not None else ""
+        out.append(f"--{boundary}\r\nContent-Type: application/http\r\n"
+                   f"Content-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                   f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n{data}\r\n")
+    return f"multipart/mixed; boundary={boundary}", "".join(out) + f"--{boundary}--\r\n"
+
+# === HTTP ===
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, payload=None, headers=None, content_type="application/json"):
+            data = payload if isinstance(payload, str) else (json.dumps(payload) if payload is not None else "")
+            data = data.encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if data:
+                self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_any(self, method):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+            split = urlsplit(self.path)
+            path = split.path
+            if path == "/_stats":
+                return self.reply(200, dict(state.stats))
+            if path == "/_reset":
+                state.reset()
+                return self.reply(204)
+
+            state.count("http_calls")
+            state.wait()
+            base_url = f"http://{self.headers.get('Host')}"
+            if path.startswith("/webhook/"):
+                state.count(f"webhook {path.rsplit('/', 1)[-1]}")
+                return self.reply(200, "ok", content_type="text/plain")
+            if path == "/batch":
+                content_type, body = google_batch(state, self.headers["Content-Type"], raw)
+                return self.reply(200, body, content_type=content_type)
+            if path.startswith(GOOGLE_PREFIX):
+                status, payload = google(state, method, path, json.loads(raw) if raw else None)
+                return self.reply(status, payload)
+            if path == f"{GRAPH_PREFIX}/$batch":
+                return self.reply(200, graph_batch(state, json.loads(raw), base_url))
+            if path.startswith(GRAPH_PREFIX):
+                status, payload, headers = graph(state, method, path[len(GRAPH_PREFIX):], parse_qs(split.query),
+                                                 json.loads(raw) if raw else None, base_url)
+                return self.reply(status, payload, headers)
+            return self.reply(404, {"error": {"message": f"No route for {path}"}})
+
+        def do_GET(self):
+            self.handle_any("GET")
+
+        def do_POST(self):
+            self.handle_any("POST")
+
+        def do_PATCH(self):
+            self.handle_any("PATCH")
+
+        def do_PUT(self):
+            self.handle_any("PUT")
+
+        def do_DELETE(self):
+            self.handle_any("DELETE")
+
+    return Handler
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def serve(port=0, **options):
+    state = FakeState(**options)
+    server = FakeServer(("127.0.0.1", port), make_handler(state))
+    return server, state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Graph / Directory API / webhook server")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to every HTTP call")
+    parser.add_argument("--jitter", type=float, default=0, help="Extra random milliseconds, 0..jitter")
+    parser.add_argument("--throttle", type=float, default=0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", default="0.05", help="Retry-After seconds sent with each 429")
+    parser.add_argument("--page-size", type=int, default=100, help="Largest memberOf page returned")
+    parser.add_argument("--groups-per-user", type=int, default=5, help="Groups each user is a member of")
+    args = parser.parse_args(argv)
+
+    server, _ = serve(args.port, latency=args.latency / 1000, jitter=args.jitter / 1000, throttle=args.throttle,
+                      retry_after=args.retry_after, page_size=args.page_size, groups_per_user=args.groups_per_user)
+    # The first line tells a parent process which port was picked.
+    print(f"listening on {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Cold-start latency of each CLI command.
+
+Every sample starts a fresh interpreter in the repo root and imports the module
+behind a command, which is what `python main.py` pays before any API call. An
+empty interpreter is timed too, so the import cost can be read off directly.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 20
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+COMMANDS = {
+    "interpreter": "pass",
+    "main": "import main",
+    "azure_onboard": "import azure_onboard",
+    "azure_offboard": "import azure_offboard",
+    "google_onboard": "import google_onboard",
+    "google_offboard": "import google_offboard",
+    "bulk onboard": "import bulk_onboard",
+    "bulk offboard": "import bulk_offboard",
+    "bulk google_onboard": "import bulk_google_onboard",
+    "bulk google_offboard": "import bulk_google_offboard"
+}
+
+# Imports that must stay off the startup path until a command actually needs them.
+HEAVY_MODULES = ("msal", "httpx", "requests", "googleapiclient.discovery")
+
+def time_command(code, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=BASE_DIR, check=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def loaded_heavy_modules(code):
+    probe = f"{code}\nimport sys\nprint(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=BASE_DIR, check=True,
+                         capture_output=True, text=True).stdout
+    return out.strip() or "-"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start latency per command")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per command")
+    args = parser.parse_args(argv)
+
+    print(f"{'command':<22}{'median ms':>10}{'min ms':>9}{'+import ms':>12}  heavy modules loaded")
+    baseline = None
+    for name, code in COMMANDS.items():
+        samples = time_command(code, args.runs)
+        median = statistics.median(samples)
+        if baseline is None:
+            baseline = median
+        print(f"{name:<22}{median:>10.1f}{min(samples):>9.1f}{median - baseline:>12.1f}  {loaded_heavy_modules(code)}")
+
+if __name__ == "__main__":
+    main()
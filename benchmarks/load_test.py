@@ -0,0 +1,357 @@
+"""Throughput and latency of onboarding and offboarding against a fake backend.
+
+Starts benchmarks/fake_server.py in a child process, points Graph, the
+Directory API and the webhooks at it, then runs each scenario at each size
+and reports users/sec, p50/p99 per-user latency and HTTP calls per user:
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --sizes 10,1000 --latency 20 --throttle 0.01
+    python benchmarks/load_test.py --save baseline.json
+    python benchmarks/load_test.py --compare baseline.json --tolerance 0.15
+
+Single scenarios run the per-user path the dashboard uses (onboard_user and
+offboard_user on the bulk worker pool); their latency is each user's own time.
+onboard-both is the same path with every row targeting Azure and Google.
+reconcile-bulk re-runs onboard-bulk over users it has already onboarded, so
+every write should be planned away. lockout-single is two-phase offboarding on
+Azure and Google; its latency is time-to-lockout, cleanup still counts in the total.
+offboard-during-bulk reports the latency of urgent lock-outs submitted while a
+bulk upload of the scenario's users is running. onboard-sharded spreads its
+users over BENCH_TENANTS tenant profiles and runs them through bulk_tenants,
+one shard per tenant.
+Bulk scenarios run the $batch chunk processors; every user in a chunk is
+given that chunk's time. With --compare, the exit status is 1 when throughput
+drops or calls per user grow by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import contextlib
+import subprocess
+import urllib.request
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAKE_SERVER = os.path.join(BASE_DIR, "benchmarks", "fake_server.py")
+
+SCENARIOS = ("onboard-single", "onboard-bulk", "reconcile-bulk", "offboard-single", "lockout-single",
+             "offboard-bulk", "google-onboard-bulk", "google-offboard-bulk", "onboard-both", "offboard-during-bulk", "onboard-sharded")
+# Offboarding scenarios reuse the users their onboarding counterpart created.
+USER_SETS = {
+    "onboard-single": "single",
+    "offboard-single": "single",
+    "lockout-single": "single",
+    "onboard-bulk": "bulk",
+    "reconcile-bulk": "bulk",
+    "offboard-bulk": "bulk",
+    "google-onboard-bulk": "google",
+    "google-offboard-bulk": "google",
+    "onboard-both": "both",
+    "offboard-during-bulk": "priority",
+    "onboard-sharded": "sharded"
+}
+# Tenant profiles written to the scratch config; each owns t<n>.example.com.
+BENCH_TENANTS = 4
+
+# === Fake backend ===
+def start_server(args):
+    command = [sys.executable, FAKE_SERVER, "--port", "0", "--latency", str(args.latency),
+               "--jitter", str(args.jitter), "--throttle", str(args.throttle),
+               "--page-size", str(args.page_size), "--groups-per-user", str(args.groups_per_user)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline().split()[-1])
+    return process, f"http://127.0.0.1:{port}"
+
+def server_call(base_url, path, method="GET"):
+    with urllib.request.urlopen(urllib.request.Request(f"{base_url}{path}", method=method)) as response:
+        body = response.read()
+    return json.loads(body) if body else None
+
+def prepare_environment(base_url):
+    # Runs in a scratch directory with its own config, so journals and uploads
+    # stay out of the repo. Must happen before any kit module is imported.
+    workdir = tempfile.mkdtemp(prefix="zerotouch-bench-")
+    with open(os.path.join(BASE_DIR, "config.json")) as f:
+        config = json.load(f)
+    config.setdefault("google_groups", ["staff@example.com"])
+    config["tenants"] = {f"bench{n}": {"tenant_id": f"bench-tenant-{n}", "client_id": "benchmark",
+                                       "domains": [f"t{n}.example.com"]} for n in range(BENCH_TENANTS)}
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump(config, f)
+    shutil.copytree(os.path.join(BASE_DIR, "templates"), os.path.join(workdir, "templates"))
+    os.chdir(workdir)
+    sys.path.insert(0, BASE_DIR)
+
+    os.environ.update({
+        "GRAPH_BASE_URL": f"{base_url}/v1.0",
+        "GOOGLE_API_ENDPOINT": f"{base_url}/",
+        "SLACK_WEBHOOK": f"{base_url}/webhook/slack",
+        "TEAMS_WEBHOOK": f"{base_url}/webhook/teams",
+        "SENDER_ADDRESS": "it@example.com"
+    })
+
+    # The fake server does not check credentials: hand out a token that never
+    # expires and a Directory client with anonymous credentials.
+    import graph_auth
+    import tenants
+    for token_provider in [graph_auth.provider] + [tenant.provider for tenant in tenants.TENANTS.values()]:
+        token_provider._token = "benchmark"
+        token_provider._expires_at = float("inf")
+
+    import google_directory
+    from googleapiclient.discovery import build
+    from google.auth.credentials import AnonymousCredentials
+    google_directory._credentials = AnonymousCredentials()
+    google_directory._service = build("admin", "directory_v1", credentials=google_directory._credentials,
+                                      static_discovery=True, cache_discovery=False,
+                                      client_options={"api_endpoint": f"{base_url}/"})
+    return workdir
+
+# === Scenarios ===
+def make_users(tag, count, domains=("example.com",)):
+    from csv_ingest import parse_onboard_row
+    users = []
+    for n in range(count):
+        user = parse_onboard_row({"Full Name": f"Bench User{n}", "Username": f"{tag}-{n}",
+                                  "Domain": domains[n % len(domains)], "Platform": "azure"})
+        user["line"] = n + 2
+        users.append(user)
+    return users
+
+def run_chunks(users, size, process):
+    latencies, failed = [], 0
+    for start in range(0, len(users), size):
+        chunk = users[start:start + size]
+        started = time.monotonic()
+        errors = process(chunk)
+        latencies += [time.monotonic() - started] * len(chunk)
+        failed += sum(1 for user in chunk if errors.get(user["line"]))
+    return latencies, failed
+
+def onboard_single(users, platform="azure"):
+    from bulk_engine import run_bulk
+    rows = [{"Full Name": user["name"], "Username": user["username"], "Domain": user["domain"], "Platform": platform}
+            for user in users]
+    results = run_bulk(rows)
+    return [result.get("seconds", 0) for result in results], sum(1 for result in results if not result["success"])
+
+def onboard_bulk(users):
+    from bulk_onboard import CHUNK_SIZE, onboard_chunk
+    from job_journal import JobJournal
+    journal = JobJournal.create("onboard", "benchmark")
+    try:
+        return run_chunks(users, CHUNK_SIZE, lambda chunk: onboard_chunk(chunk, journal))
+    finally:
+        journal.close()
+
+def offboard_single(users):
+    from scheduler import scheduler
+    from azure_offboard import offboard_user
+
+    def offboard(upn):
+        started = time.monotonic()
+        try:
+            offboard_user(upn)
+            return time.monotonic() - started, False
+        except Exception:
+            return time.monotonic() - started, True
+
+    results = scheduler.map("offboard", offboard, [user["upn"] for user in users])
+    return [seconds for seconds, _ in results], sum(1 for _, failed in results if failed)
+
+def lockout_single(users):
+    # Latency is time-to-lockout; the deferred cleanup is waited for in drain().
+    from scheduler import scheduler
+    from lockout import lock_out_user
+
+    def lock_out(upn):
+        started = time.monotonic()
+        outcomes, _ = lock_out_user(upn, ["azure", "google"])
+        return time.monotonic() - started, not all(outcome["success"] for outcome in outcomes.values())
+
+    results = scheduler.map("offboard", lock_out, [user["upn"] for user in users])
+    return [seconds for seconds, _ in results], sum(1 for _, failed in results if failed)
+
+def offboard_during_bulk(users):
+    # A bulk upload of every user runs while one urgent lock-out per 20 users
+    # arrives; latency is each lock-out's, from submission, queue wait included.
+    import threading
+    from scheduler import scheduler
+    from lockout import lock_out_user
+    upload = threading.Thread(target=onboard_single, args=(users,))
+    upload.start()
+    latencies, failed = [], 0
+    for n in range(max(1, len(users) // 20)):
+        time.sleep(0.05)
+        started = time.monotonic()
+        outcomes, _ = scheduler.submit("offboard", lock_out_user, f"urgent-{len(users)}-{n}@example.com", ["azure"]).result()
+        latencies.append(time.monotonic() - started)
+        failed += not all(outcome["success"] for outcome in outcomes.values())
+    upload.join()
+    return latencies, failed
+
+def offboard_bulk(users):
+    from bulk_offboard import CHUNK_SIZE, offboard_chunk
+    from job_journal import JobJournal
+    journal = JobJournal.create("offboard", "benchmark")
+    try:
+        return run_chunks([{"upn": user["upn"], "line": user["line"]} for user in users], CHUNK_SIZE,
+                          lambda chunk: offboard_chunk(chunk, journal))
+    finally:
+        journal.close()
+
+def onboard_sharded(users):
+    from bulk_tenants import run_shards
+    from job_journal import JobJournal
+    journal = JobJournal.create("sharded-onboard", "benchmark")
+    try:
+        shards = run_shards(users, "onboard", journal)
+    finally:
+        journal.close()
+    return ([seconds for shard in shards.values() for seconds in shard.latencies],
+            sum(shard.counts["failed"] for shard in shards.values()))
+
+def google_onboard_bulk(users):
+    from google_directory import MAX_BATCH_SIZE
+    from bulk_google_onboard import onboard_chunk
+    return run_chunks(users, MAX_BATCH_SIZE, lambda chunk: onboard_chunk(chunk)[0])
+
+def google_offboard_bulk(users):
+    from google_directory import MAX_BATCH_SIZE
+    from bulk_google_offboard import offboard_chunk
+    return run_chunks(users, MAX_BATCH_SIZE, offboard_chunk)
+
+RUNNERS = {
+    "onboard-single": onboard_single,
+    "onboard-bulk": onboard_bulk,
+    "reconcile-bulk": onboard_bulk,
+    "offboard-single": offboard_single,
+    "lockout-single": lockout_single,
+    "offboard-bulk": offboard_bulk,
+    "google-onboard-bulk": google_onboard_bulk,
+    "google-offboard-bulk": google_offboard_bulk,
+    "onboard-both": lambda users: onboard_single(users, "azure;google"),
+    "offboard-during-bulk": offboard_during_bulk,
+    "onboard-sharded": onboard_sharded
+}
+
+def drain():
+    # Deferred cleanup, mail and webhook posts count towards the run that caused them.
+    import email_notify
+    import lockout
+    import notifier
+    lockout.flush()
+    email_notify.flush()
+    notifier.flush()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def run_scenario(base_url, name, size):
+    import directory_cache
+    domains = [f"t{n}.example.com" for n in range(BENCH_TENANTS)] if name == "onboard-sharded" else ["example.com"]
+    users = make_users(f"{USER_SETS[name]}-{size}", size, domains)
+    # Caches start cold, as they would for a separate run.
+    directory_cache.clear()
+    server_call(base_url, "/_reset", "POST")
+
+    started = time.monotonic()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        latencies, failed = RUNNERS[name](users)
+        drain()
+    elapsed = time.monotonic() - started
+
+    calls = server_call(base_url, "/_stats")
+    return {
+        "scenario": name,
+        "users": size,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "users_per_sec": round(size / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "http_calls_per_user": round(calls.get("http_calls", 0) / size, 3),
+        "api_requests_per_user": round((calls.get("http_calls", 0) - calls.get("graph $batch", 0)
+                                        - calls.get("google batch", 0) + calls.get("sub_requests", 0)) / size, 3),
+        "throttled": calls.get("throttled", 0)
+    }
+
+# === Reporting ===
+def print_table(results):
+    print(f"{'scenario':<22}{'users':>7}{'failed':>7}{'users/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'HTTP/user':>11}{'API/user':>10}{'429s':>7}")
+    for r in results:
+        print(f"{r['scenario']:<22}{r['users']:>7}{r['failed']:>7}{r['users_per_sec']:>10}{r['p50_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['http_calls_per_user']:>11}{r['api_requests_per_user']:>10}{r['throttled']:>7}")
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["users"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        before = baseline.get((r["scenario"], r["users"]))
+        if not before:
+            continue
+        if r["users_per_sec"] < before["users_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']} @ {r['users']}: {before['users_per_sec']} → {r['users_per_sec']} users/s")
+        if r["http_calls_per_user"] > before["http_calls_per_user"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']} @ {r['users']}: {before['http_calls_per_user']} → "
+                               f"{r['http_calls_per_user']} HTTP calls/user")
+    for regression in regressions:
+        print(f"❌ Regression: {regression}")
+    if not regressions:
+        print(f"✅ No regressions beyond {tolerance:.0%} against {baseline_path}")
+    return not regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test onboarding and offboarding against a fake backend")
+    parser.add_argument("--sizes", default="10,1000,50000", help="Comma-separated user counts")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Any of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=20, help="Milliseconds per fake HTTP call")
+    parser.add_argument("--jitter", type=float, default=5, help="Random extra milliseconds per call")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Fraction of requests answered 429")
+    parser.add_argument("--page-size", type=int, default=100, help="Largest memberOf page")
+    parser.add_argument("--groups-per-user", type=int, default=5, help="Groups per offboarded user")
+    parser.add_argument("--save", metavar="FILE", help="Write results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Fail on regressions against saved results")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    server, base_url = start_server(args)
+    cwd = os.getcwd()
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = prepare_environment(base_url)
+    results = []
+    try:
+        for size in sizes:
+            for name in scenarios:
+                result = run_scenario(base_url, name, size)
+                results.append(result)
+                print(f"… {name} × {size}: {result['users_per_sec']} users/s", file=sys.stderr)
+    finally:
+        server.terminate()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_table(results)
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump({"options": vars(args), "results": results}, f, indent=2)
+    if compare_path and not compare(results, compare_path, args.tolerance):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Welcome email rendering: compiled, cached templates vs. read-and-replace.
+
+The legacy function below is the renderer email_notify used before
+email_templates: it re-reads the file and runs one str.replace per key on
+every call.
+
+    python benchmarks/render_template.py
+    python benchmarks/render_template.py --renders 50000
+"""
+import os
+import sys
+import time
+import argparse
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BASE_DIR)
+
+from email_templates import render_template
+
+TEMPLATE = os.path.join(BASE_DIR, "templates", "welcome_email.html")
+
+def legacy_render_template(path, replacements):
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read()
+        for key, value in replacements.items():
+            content = content.replace(f"{{{{{key}}}}}", value)
+        return content
+
+def values(n):
+    return {
+        "name": f"New Hire {n}",
+        "upn": f"hire{n}@example.com",
+        "password": "TempPass@123",
+        "logo_url": "https://yourcompany.com/logo.png"
+    }
+
+def time_renders(render, renders):
+    started = time.perf_counter()
+    for n in range(renders):
+        render(TEMPLATE, values(n))
+    return time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare template renderers")
+    parser.add_argument("--renders", type=int, default=10000, help="Renders per implementation")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, render in (("read + replace", legacy_render_template), ("compiled + cached", render_template)):
+        render(TEMPLATE, values(0))  # warm-up
+        results[name] = time_renders(render, args.renders)
+        print(f"{name:<20}{results[name]:>8.3f}s  {results[name] / args.renders * 1e6:>8.1f} µs/render")
+
+    print(f"speed-up: {results['read + replace'] / results['compiled + cached']:.1f}x")
+
+if __name__ == "__main__":
+    main()
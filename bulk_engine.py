@@ -0,0 +1,80 @@
+import os
+import json
+import time
+from concurrent.futures import as_completed
+from dotenv import load_dotenv
+from csv_ingest import SeenSet, chunked, parse_onboard_row
+from notifier import coalescing
+from email_notify import mail_digest
+from log_store import log_event
+import providers
+import scheduler
+import metrics
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Rows run on the shared scheduler's bulk lane, one task per row, so
+# offboards and manual onboards overtake a running upload at row boundaries.
+CHUNK_SIZE = int(CONFIG.get("bulk_chunk_size", 200))
+
+# === Row processing ===
+def onboard_user_row(user, result):
+    # Every platform the row names is provisioned at once; the row succeeds
+    # only if all of them do. Per-platform outcomes are kept on the result.
+    started = time.monotonic()
+    outcomes = providers.onboard(user)
+    result["platforms"] = outcomes
+    result["success"] = all(outcome["success"] for outcome in outcomes.values())
+    if not result["success"]:
+        result["error"] = "; ".join(f"{name}: {outcome['error']}" for name, outcome in outcomes.items()
+                                    if not outcome["success"])
+    result["seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+def run_bulk(rows, on_result=None):
+    # Rows are validated and deduplicated as they stream in; only good rows are
+    # handed to the pool, one bounded chunk at a time. on_result is called as
+    # each row finishes, in completion order. Per-user Slack/Teams messages are
+    # coalesced into digests, and each email recipient (a hiring manager, say)
+    # gets one merged message for the whole run.
+    on_result = on_result or (lambda result: None)
+    since, started = metrics.snapshot(), time.monotonic()
+    with coalescing(), mail_digest():
+        results = _run_bulk(rows, on_result)
+    succeeded = sum(1 for result in results if result["success"])
+    log_event("bulk_onboard", "SUCCESS" if succeeded == len(results) else "ERROR", duration=time.monotonic() - started,
+              rows=len(results), succeeded=succeeded, steps=metrics.summary(since))
+    return results
+
+def _run_bulk(rows, on_result):
+    seen = SeenSet()
+    results = []
+    for chunk in chunked(rows, CHUNK_SIZE):
+        futures = []
+        for row in chunk:
+            username = row.get("Username")
+            domain = row.get("Domain")
+            platform = (row.get("Platform") or "").strip().lower()
+            result = {"name": row.get("Full Name"), "email": f"{username}@{domain}", "platform": platform, "success": False}
+            results.append(result)
+            try:
+                user = parse_onboard_row(row)
+            except ValueError as e:
+                result["error"] = str(e)
+                on_result(result)
+                continue
+            result["platform"] = user["platform"]
+            if not seen.add(user["upn"]):
+                result["error"] = f"duplicate UPN '{user['upn']}'"
+                on_result(result)
+                continue
+            futures.append(scheduler.submit("bulk", onboard_user_row, user, result))
+
+        for future in as_completed(futures):
+            on_result(future.result())
+    return results
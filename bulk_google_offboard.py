@@ -0,0 +1,61 @@
+import argparse
+from dotenv import load_dotenv
+from notifier import notify_all
+import metrics
+from google_directory import MAX_BATCH_SIZE, get_service, run_batch, error_message
+from csv_ingest import OFFBOARD_COLUMNS, read_csv, ingest, chunked, parse_offboard_row
+
+load_dotenv()
+
+# === Chunk Processor ===
+def offboard_chunk(users):
+    # Batch request ids are CSV line numbers, so callbacks map straight back to rows.
+    service = get_service()
+    errors = {}
+
+    def on_suspend(request_id, response, error):
+        if error:
+            errors[int(request_id)] = f"suspend: {error_message(error)}"
+
+    run_batch([
+        (str(user["line"]), service.users().update(userKey=user["upn"], body={"suspended": True}))
+        for user in users
+    ], on_suspend)
+    return errors
+
+# === Bulk Processor ===
+def process_csv(file_path):
+    rows = read_csv(file_path, OFFBOARD_COLUMNS)
+    since = metrics.snapshot()
+    print(f"🔒 Suspending Google Workspace users in batches of up to {MAX_BATCH_SIZE}...")
+
+    counts = {"succeeded": 0, "failed": 0, "rejected": 0}
+
+    def reject(line, reason):
+        counts["rejected"] += 1
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    for chunk in chunked(ingest(rows, parse_offboard_row, reject), MAX_BATCH_SIZE):
+        errors = offboard_chunk(chunk)
+        for user in chunk:
+            if user["line"] in errors:
+                counts["failed"] += 1
+                print(f"❌ Failed: {user['upn']} — {errors[user['line']]}")
+            else:
+                counts["succeeded"] += 1
+                print(f"⚠️ Suspended Google user: {user['upn']}")
+
+    print(f"📊 {counts['succeeded']} suspended, {counts['failed']} failed, {counts['rejected']} rejected")
+    metrics.print_summary(since)
+    notify_all(f"⚠️ GWS bulk offboarding: *{counts['succeeded']}* users suspended, {counts['failed']} failed")
+    return counts
+
+# === Run ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk suspend Google Workspace users from CSV")
+    parser.add_argument("csv", nargs="?", default="users_offboard.csv", help="CSV file to process")
+    args = parser.parse_args(argv)
+    process_csv(args.csv)
+
+if __name__ == "__main__":
+    main()
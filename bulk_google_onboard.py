@@ -0,0 +1,96 @@
+import os
+import json
+import argparse
+from dotenv import load_dotenv
+from notifier import notify_all
+import metrics
+from google_onboard import user_body
+from google_directory import MAX_BATCH_SIZE, get_service, run_batch, error_message
+from csv_ingest import ONBOARD_COLUMNS, read_csv, ingest, chunked, parse_onboard_row
+
+load_dotenv()
+
+# === Load config ===
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+GROUPS = CONFIG.get("google_groups", [])
+
+# === Chunk Processor ===
+def onboard_chunk(users):
+    # Batch request ids are CSV line numbers, so callbacks map straight back to rows.
+    service = get_service()
+    errors = {user["line"]: [] for user in users}
+    emails = {}
+
+    def on_insert(request_id, response, error):
+        if error:
+            errors[int(request_id)].append(f"create: {error_message(error)}")
+        else:
+            emails[int(request_id)] = response["primaryEmail"]
+
+    run_batch([
+        (str(user["line"]), service.users().insert(body=user_body(user["name"], user["username"])))
+        for user in users
+    ], on_insert)
+
+    def on_member(request_id, response, error):
+        if error:
+            line, _, group = request_id.partition(":")
+            errors[int(line)].append(f"group {group}: {error_message(error)}")
+
+    run_batch([
+        (f"{line}:{group}", service.members().insert(groupKey=group, body={"email": email, "role": "MEMBER"}))
+        for line, email in emails.items()
+        for group in GROUPS
+    ], on_member)
+
+    return errors, emails
+
+# === Bulk Processor ===
+def process_csv(file_path):
+    rows = read_csv(file_path, ONBOARD_COLUMNS)
+    since = metrics.snapshot()
+    print(f"🔧 Onboarding Google Workspace users in batches of up to {MAX_BATCH_SIZE}...")
+
+    counts = {"succeeded": 0, "failed": 0, "rejected": 0, "skipped": 0}
+
+    def reject(line, reason):
+        counts["rejected"] += 1
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    def google_rows():
+        # Only rows whose Platform includes Google; an "azure" row gets no Workspace account.
+        for user in ingest(rows, parse_onboard_row, reject):
+            if "google" in user["platforms"]:
+                yield user
+            else:
+                counts["skipped"] += 1
+
+    for chunk in chunked(google_rows(), MAX_BATCH_SIZE):
+        errors, emails = onboard_chunk(chunk)
+        for user in chunk:
+            if errors[user["line"]]:
+                counts["failed"] += 1
+                print(f"❌ Failed: {user['name']} — {'; '.join(errors[user['line']])}")
+            else:
+                counts["succeeded"] += 1
+                print(f"✅ Google Workspace user created: {emails[user['line']]}")
+
+    print(f"📊 {counts['succeeded']} onboarded, {counts['failed']} failed, {counts['rejected']} rejected, "
+          f"{counts['skipped']} not for Google Workspace")
+    metrics.print_summary(since)
+    notify_all(f"✅ GWS bulk onboarding: *{counts['succeeded']}* users onboarded, {counts['failed']} failed")
+    return counts
+
+# === Run ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk onboard Google Workspace users from CSV")
+    parser.add_argument("csv", nargs="?", default="users.csv", help="CSV file to process")
+    args = parser.parse_args(argv)
+    process_csv(args.csv)
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,226 @@
-import csv
 import os
-import requests
-from msal import ConfidentialClientApplication
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlencode
 from dotenv import load_dotenv
+from graph_client import MEMBER_OF_PARAMS, stats, run, list_all
+from graph_batch import MAX_BATCH_SIZE, batch_request, run_batch, is_success, error_message
+from job_journal import JobJournal
+import metrics
+from directory_cache import user_ids, forget_user
+from csv_ingest import OFFBOARD_COLUMNS, read_csv, ingest, chunked, parse_offboard_row
+from tenants import setting
 
 load_dotenv()
 
-# === Auth config ===
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://graph.microsoft.com/.default"]
-
-# === MSAL Token ===
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
-
-token = app.acquire_token_for_client(scopes=SCOPE)
-if "access_token" not in token:
-    raise Exception("Authentication failed.")
-
-headers = {
-    "Authorization": f"Bearer {token['access_token']}",
-    "Content-Type": "application/json"
-}
-
-# === Core Functions ===
-def get_user_id(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}"
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    return r.json()["id"]
-
-def disable_user(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}"
-    data = { "accountEnabled": False }
-    r = requests.patch(url, headers=headers, json=data)
-    r.raise_for_status()
-
-def remove_licenses(upn):
-    url = f"https://graph.microsoft.com/v1.0/users/{upn}/assignLicense"
-    data = {
-        "addLicenses": [],
-        "removeLicenses": ["ENTER_SKU_ID"]  # Replace with actual
-    }
-    r = requests.post(url, headers=headers, json=data)
-    r.raise_for_status()
-
-def remove_from_all_groups(user_id):
-    url = f"https://graph.microsoft.com/v1.0/users/{user_id}/memberOf"
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    groups = r.json()["value"]
-
-    for group in groups:
-        if group["@odata.type"] == "#microsoft.graph.group":
-            group_id = group["id"]
-            delete_url = f"https://graph.microsoft.com/v1.0/groups/{group_id}/members/{user_id}/$ref"
-            del_req = requests.delete(delete_url, headers=headers)
-            del_req.raise_for_status()
+# === Load config ===
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+STEPS = ("disable", "revoke", "license", "groups")
+LOCKOUT_STEPS = ("disable", "revoke")
+CHUNK_SIZE = int(CONFIG.get("bulk_chunk_size", 200))
+MEMBER_OF_QUERY = urlencode(MEMBER_OF_PARAMS, safe="$")
+
+# === Batch Requests ===
+def offboard_requests(index, upn, done):
+    disable_id = f"{index}-disable"
+    batch = []
+    if "disable" not in done:
+        batch.append(batch_request(disable_id, "PATCH", f"/users/{upn}", { "accountEnabled": False }))
+    if "license" not in done:
+        batch.append(batch_request(f"{index}-license", "POST", f"/users/{upn}/assignLicense", {
+            "addLicenses": [],
+            "removeLicenses": [setting("license_sku_id")]
+        }, depends_on=None if "disable" in done else [disable_id]))
+    if "groups" not in done:
+        # The id is read alongside memberOf, never taken from the cache: after a
+        # rehire the cached id belongs to the deleted account, its DELETEs would
+        # all 404 and the live account would keep its groups.
+        batch.append(batch_request(f"{index}-id", "GET", f"/users/{upn}?$select=id"))
+        batch.append(batch_request(f"{index}-memberOf", "GET", f"/users/{upn}/memberOf/microsoft.graph.group?{MEMBER_OF_QUERY}"))
+    return batch
+
+def lockout_requests(index, upn, done):
+    batch = []
+    if "disable" not in done:
+        batch.append(batch_request(f"{index}-disable", "PATCH", f"/users/{upn}", { "accountEnabled": False }))
+    if "revoke" not in done:
+        batch.append(batch_request(f"{index}-revoke", "POST", f"/users/{upn}/revokeSignInSessions"))
+    return batch
+
+def group_removal_requests(index, user_id, group_ids):
+    return [
+        batch_request(f"{index}-group-{group_id}", "DELETE", f"/groups/{group_id}/members/{user_id}/$ref")
+        for group_id in group_ids
+    ]
+
+async def read_pages(links):
+    return await asyncio.gather(*(list_all(link) for link in links), return_exceptions=True)
+
+# === Chunk Processors ===
+def lock_out_chunk(users, journal):
+    # Disable and session revocation only, ten users per $batch round-trip.
+    # time_to_lockout is timed per chunk, the same clock lock_out_user uses for
+    # one user, so bulk and single lock-outs share one distribution.
+    errors = {user["line"]: [] for user in users}
+    started = time.monotonic()
+    responses = run_batch(lockout_requests(user["line"], user["upn"], journal.steps(user["upn"])) for user in users)
+    elapsed = time.monotonic() - started
+    for user in users:
+        index = user["line"]
+        for step in LOCKOUT_STEPS:
+            response = responses.get(f"{index}-{step}")
+            if is_success(response):
+                journal.record(user["upn"], step)
+            elif response is not None:
+                errors[index].append(f"{step}: {error_message(response)}")
+        metrics.observe("time_to_lockout", elapsed, "failed" if errors[index] else None)
+    return errors
+
+def offboard_chunk(users, journal):
+    # Request ids are keyed by CSV line so every sub-response maps back to its row.
+    errors = {user["line"]: [] for user in users}
+
+    # Phase 1: disable (unless the lock-out pass did), then strip the license;
+    # read id and memberships alongside.
+    # Steps already in the journal are skipped; disabling and license removal are
+    # safe to repeat.
+    responses = run_batch(
+        offboard_requests(user["line"], user["upn"], journal.steps(user["upn"])) for user in users
+    )
+    grouped = []
+    next_pages = {}
+    for user in users:
+        index = user["line"]
+        for step in ("disable", "license"):
+            response = responses.get(f"{index}-{step}")
+            if is_success(response):
+                journal.record(user["upn"], step)
+            elif response is not None:
+                errors[index].append(f"{step}: {error_message(response)}")
+
+        found = responses.get(f"{index}-id")
+        member_of = responses.get(f"{index}-memberOf")
+        if member_of is None:
+            continue
+        if not is_success(found):
+            errors[index].append(f"groups: {error_message(found)}")
+            continue
+        if not is_success(member_of):
+            errors[index].append(f"groups: {error_message(member_of)}")
+            continue
+        user["id"] = found["body"]["id"]
+        user_ids.set(user["upn"], user["id"])
+        user["groups"] = [group["id"] for group in member_of["body"]["value"]]
+        if "@odata.nextLink" in member_of["body"]:
+            next_pages[index] = member_of["body"]["@odata.nextLink"]
+        grouped.append(user)
+    by_line = {user["line"]: user for user in grouped}
+
+    # Users in more groups than fit on one page: read the remaining pages directly.
+    if next_pages:
+        pages = run(read_pages(next_pages.values()))
+        unread = set()
+        for index, page in zip(next_pages, pages):
+            if isinstance(page, Exception):
+                errors[index].append(f"groups: {page}")
+                unread.add(index)
+            else:
+                by_line[index]["groups"].extend(group["id"] for group in page)
+        grouped = [user for user in grouped if user["line"] not in unread]
+
+    removal_batches = []
+    for user in grouped:
+        removals = group_removal_requests(user["line"], user["id"], user["groups"])
+        removal_batches.extend([request] for request in removals)
+
+    # Phase 2: delete memberships now that the user id is known. The id was read
+    # in this same pass, so a 404 means the membership is already gone.
+    responses = run_batch(removal_batches)
+    for request_id, response in responses.items():
+        if not is_success(response) and response["status"] != 404:
+            index, _, group_id = request_id.split("-", 2)
+            errors[int(index)].append(f"group {group_id}: {error_message(response)}")
+    for user in grouped:
+        forget_user(user_id=user["id"])
+        if not errors[user["line"]]:
+            journal.record(user["upn"], "groups")
+
+    return errors
 
 # === Bulk Processor ===
-def process_csv(file_path):
-    with open(file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            upn = row["UPN"].strip()
-            try:
-                print(f"🔒 Offboarding: {upn}...")
-                disable_user(upn)
-                remove_licenses(upn)
-                user_id = get_user_id(upn)
-                remove_from_all_groups(user_id)
-                print(f"✅ Success: {upn}\n")
-            except Exception as e:
-                print(f"❌ Failed: {upn} — {e}\n")
+def process_csv(file_path, journal=None):
+    rows = read_csv(file_path, OFFBOARD_COLUMNS)
+    since = metrics.snapshot()
+    journal = journal or JobJournal.create("offboard", file_path)
+    print(f"🗒️ Job {journal.job_id} (resume with --resume {journal.job_id})")
+    print(f"🔒 Offboarding in chunks of {CHUNK_SIZE} rows, $batch envelopes of up to {MAX_BATCH_SIZE} requests...")
+
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0, "rejected": 0, "locked_out": 0}
+
+    def reject(line, reason):
+        counts["rejected"] += 1
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    # Pass 1 locks every user out before any cleanup starts, so the last row
+    # of a large file is not left signed in while earlier rows lose their groups.
+    # Bad rows are rejected before any network call; good rows go out in bounded chunks.
+    # Pass 2 reuses pass 1's parsed rows (UPN and line only) rather than reading
+    # the file again, so it works on exactly the rows that were locked out.
+    started = time.monotonic()
+    locked = []
+    for chunk in chunked(ingest(rows, parse_offboard_row, reject), CHUNK_SIZE):
+        pending = [user for user in chunk if not journal.is_done(user["upn"], *LOCKOUT_STEPS)]
+        errors = lock_out_chunk(pending, journal)
+        for user in pending:
+            if errors[user["line"]]:
+                print(f"❌ Lock-out failed: {user['upn']} — {'; '.join(errors[user['line']])}")
+            else:
+                counts["locked_out"] += 1
+        locked.append(chunk)
+    print(f"🔒 {counts['locked_out']} users locked out in {time.monotonic() - started:.1f}s")
+
+    # Pass 2: licenses and group memberships.
+    for chunk in locked:
+        pending = [user for user in chunk if not journal.is_done(user["upn"], *STEPS)]
+        counts["skipped"] += len(chunk) - len(pending)
+        errors = offboard_chunk(pending, journal)
+        for user in pending:
+            if errors[user["line"]]:
+                counts["failed"] += 1
+                print(f"❌ Failed: {user['upn']} — {'; '.join(errors[user['line']])}")
+            else:
+                counts["succeeded"] += 1
+                print(f"✅ Success: {user['upn']}")
+
+    summary = stats()
+    print(f"📊 {counts['succeeded']} offboarded, {counts['failed']} failed, "
+          f"{counts['skipped']} already done, {counts['rejected']} rejected")
+    print(f"📈 {summary['requests']} Graph calls, {summary['retries']} retries, "
+          f"{summary['throttle_seconds']:.1f}s waiting on throttling")
+    metrics.print_summary(since)
+    journal.close()
+    return counts
 
 # === Run ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk offboard users from CSV")
+    parser.add_argument("csv", nargs="?", default="users_offboard.csv", help="CSV file to process")
+    parser.add_argument("--resume", metavar="JOB_ID", help="Resume a previous job, skipping finished steps")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        journal = JobJournal.resume(args.resume)
+        if journal.kind != "offboard":
+            parser.error(f"Job {args.resume} is a {journal.kind} job")
+        process_csv(journal.source, journal)
+    else:
+        process_csv(args.csv)
+
 if __name__ == "__main__":
-    process_csv("users_offboard.csv")
+    main()
@@ -1,98 +1,297 @@
-import csv
 import os
 import json
-import requests
-from msal import ConfidentialClientApplication
+import argparse
 from dotenv import load_dotenv
+from graph_client import stats
+from graph_batch import (GRAPH_URL, MAX_BATCH_SIZE, batch_request, run_batch,
+                         is_success, is_conflict, error_message)
+from job_journal import JobJournal
+import metrics
+from directory_cache import MISSING, user_ids
+from csv_ingest import ONBOARD_COLUMNS, read_csv, ingest, chunked, parse_onboard_row
+from planner import Planner, is_empty, describe, totals
+from tenants import setting
 
 load_dotenv()
 
-# === Auth config ===
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://graph.microsoft.com/.default"]
-
 # === Load config ===
-with open("config.json") as f:
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
     CONFIG = json.load(f)
 
-# === Token setup ===
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
-
-token = app.acquire_token_for_client(scopes=SCOPE)
-if "access_token" not in token:
-    raise Exception("Authentication failed.")
-
-headers = {
-    "Authorization": f"Bearer {token['access_token']}",
-    "Content-Type": "application/json"
-}
-
-# === Core Functions ===
-def create_user(display_name, user_principal_name, mail_nickname):
-    url = "https://graph.microsoft.com/v1.0/users"
-    data = {
+STEPS = ("create", "license", "groups")
+CHUNK_SIZE = int(CONFIG.get("bulk_chunk_size", 200))
+# Graph accepts up to 20 members per members@odata.bind PATCH.
+BIND_SIZE = 20
+
+# === Batch Requests ===
+def create_request(index, display_name, user_principal_name, mail_nickname):
+    return batch_request(f"{index}-create", "POST", "/users", {
         "accountEnabled": True,
         "displayName": display_name,
         "mailNickname": mail_nickname,
         "userPrincipalName": user_principal_name,
         "passwordProfile": {
             "forceChangePasswordNextSignIn": True,
-            "password": CONFIG["default_password"]
-        }
-    }
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    return response.json()["id"]
-
-def add_user_to_groups(user_id):
-    for group_id in CONFIG["groups"]:
-        url = f"https://graph.microsoft.com/v1.0/groups/{group_id}/members/$ref"
-        data = {
-            "@odata.id": f"https://graph.microsoft.com/v1.0/directoryObjects/{user_id}"
+            "password": setting("default_password")
         }
-        r = requests.post(url, headers=headers, json=data)
-        r.raise_for_status()
+    })
 
-def assign_license(user_id):
-    url = f"https://graph.microsoft.com/v1.0/users/{user_id}/assignLicense"
-    data = {
+def license_request(index, user_principal_name, depends_on=None):
+    return batch_request(f"{index}-license", "POST", f"/users/{user_principal_name}/assignLicense", {
         "addLicenses": [
             {
-                "skuId": CONFIG["license_sku_id"]
+                "skuId": setting("license_sku_id")
             }
         ],
         "removeLicenses": []
-    }
-    r = requests.post(url, headers=headers, json=data)
-    r.raise_for_status()
+    }, depends_on=depends_on)
+
+def lookup_request(index, user_principal_name):
+    return batch_request(f"{index}-lookup", "GET", f"/users/{user_principal_name}?$select=id")
+
+def enable_request(index, user_principal_name):
+    return batch_request(f"{index}-enable", "PATCH", f"/users/{user_principal_name}", {"accountEnabled": True})
+
+def rename_request(index, user_principal_name, display_name):
+    return batch_request(f"{index}-rename", "PATCH", f"/users/{user_principal_name}", {"displayName": display_name})
+
+def group_requests(index, user_id, groups=None):
+    # Only the given groups (default: all of them); ids keep the group's
+    # position in setting("groups") so errors map back to it.
+    return [
+        batch_request(f"{index}-group-{n}", "POST", f"/groups/{group_id}/members/$ref", {
+            "@odata.id": f"{GRAPH_URL}/directoryObjects/{user_id}"
+        })
+        for n, group_id in enumerate(setting("groups"))
+        if groups is None or group_id in groups
+    ]
+
+def bind_request(request_id, group_id, user_ids):
+    return batch_request(request_id, "PATCH", f"/groups/{group_id}", {
+        "members@odata.bind": [f"{GRAPH_URL}/directoryObjects/{user_id}" for user_id in user_ids]
+    })
+
+# === Group membership ===
+def add_members(additions, errors, planner):
+    # additions maps group id -> [(line, user id)]. Writes are group-major: one
+    # members@odata.bind PATCH adds up to 20 users to a group. Graph rejects the
+    # whole PATCH if any one member fails, so a failed chunk is retried one
+    # member at a time to find the offending user.
+    chunks, binds = {}, []
+    for group_id, members in additions.items():
+        for start in range(0, len(members), BIND_SIZE):
+            request_id = f"bind-{len(chunks)}"
+            chunks[request_id] = (group_id, members[start:start + BIND_SIZE])
+            binds.append([bind_request(request_id, group_id, [user_id for _, user_id in chunks[request_id][1]])])
+    responses = run_batch(binds)
+
+    singles = []
+    for request_id, (group_id, members) in chunks.items():
+        if is_success(responses.get(request_id)):
+            for _, user_id in members:
+                planner.joined(group_id, user_id)
+        else:
+            singles.extend([request] for index, user_id in members
+                           for request in group_requests(index, user_id, [group_id]))
+    fallback = run_batch(singles)
+
+    # Memberships that already exist count as done, so reruns are harmless.
+    for request in (request for group in singles for request in group):
+        index, _, n = request["id"].partition("-group-")
+        group_id = setting("groups")[int(n)]
+        response = fallback.get(request["id"])
+        if is_success(response) or is_conflict(response):
+            planner.joined(group_id, request["body"]["@odata.id"].rsplit("/", 1)[-1])
+        else:
+            errors[int(index)].append(f"group {group_id}: {error_message(response)}")
+
+# === Chunk Processor ===
+def onboard_chunk(users, journal, planner=None):
+    # Current state is read first and only the difference is written: users
+    # that exist, are enabled, licensed and in every group cost no writes.
+    # Request ids are keyed by CSV line so every sub-response maps back to its row.
+    planner = planner or Planner()
+    plans, unreadable = planner.plan(users)
+    errors = {user["line"]: [] for user in users}
+    # Rows whose current state could not be read fail here and write nothing.
+    for index, error in unreadable.items():
+        errors[index].append(error)
+    users = [user for user in users if user["line"] in plans]
+    ids = {index: plan["id"] for index, plan in plans.items() if plan["id"]}
+
+    # Phase 1: create missing users and license them once the create succeeds;
+    # enable, rename and license existing users.
+    batches = []
+    for user in users:
+        index = user["line"]
+        plan = plans[index]
+        batch = []
+        if plan["create"]:
+            batch.append(create_request(index, user["name"], user["upn"], user["mail_nickname"]))
+        if plan["enable"]:
+            batch.append(enable_request(index, user["upn"]))
+        if plan["rename"]:
+            batch.append(rename_request(index, user["upn"], user["name"]))
+        if plan["license"]:
+            batch.append(license_request(index, user["upn"], [f"{index}-create"] if plan["create"] else None))
+        if batch:
+            batches.append(batch)
+    responses = run_batch(batches)
+
+    # A user created since the plan was read (another run, or directory
+    # replication lag) conflicts: look their id up and finish the license.
+    lookups = []
+    for user in users:
+        index = user["line"]
+        if is_conflict(responses.get(f"{index}-create")):
+            batch = []
+            cached_id = user_ids.get(user["upn"])
+            if cached_id is MISSING:
+                batch.append(lookup_request(index, user["upn"]))
+            else:
+                ids[index] = cached_id
+            batch.append(license_request(index, user["upn"]))
+            lookups.append(batch)
+    responses.update(run_batch(lookups))
+
+    for user in users:
+        index = user["line"]
+        created = responses.get(f"{index}-create")
+        looked_up = responses.get(f"{index}-lookup")
+        if is_success(created):
+            ids[index] = created["body"]["id"]
+            planner.created(ids[index])
+        elif is_success(looked_up):
+            ids[index] = looked_up["body"]["id"]
+        if is_success(created) or is_success(looked_up):
+            user_ids.set(user["upn"], ids[index])
+        if index in ids:
+            journal.record(user["upn"], "create", {"id": ids[index]})
+        else:
+            errors[index].append(f"create: {error_message(looked_up or created)}")
+
+        for step in ("enable", "rename"):
+            response = responses.get(f"{index}-{step}")
+            if response is not None and not is_success(response):
+                errors[index].append(f"{step}: {error_message(response)}")
+
+        licensed = responses.get(f"{index}-license")
+        if licensed is None or is_success(licensed):
+            journal.record(user["upn"], "license")
+        else:
+            errors[index].append(f"license: {error_message(licensed)}")
+
+    # Phase 2: every user's missing groups, regrouped by group so a wave of
+    # hires costs one write per 20 members per group. Users found by the
+    # conflict lookup have their memberships read first.
+    unreadable = planner.read(ids.values())
+    additions = {}
+    for user in users:
+        user_id = ids.get(user["line"])
+        if user_id in unreadable:
+            errors[user["line"]].append(f"read groups: {unreadable[user_id]}")
+            continue
+        for group_id in planner.missing_groups(user_id) if user_id else []:
+            additions.setdefault(group_id, []).append((user["line"], user_id))
+    add_members(additions, errors, planner)
+
+    for user in users:
+        if user["line"] in ids and not errors[user["line"]]:
+            journal.record(user["upn"], "groups")
+    planner.done(ids.values())
+
+    return errors
+
+def print_plan(users, plans):
+    for user in users:
+        plan = plans[user["line"]]
+        if not is_empty(plan):
+            print(f"📝 {user['upn']}: {describe(plan)}")
 
 # === Bulk Processor ===
-def process_csv(file_path):
-    with open(file_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            full_name = row["Full Name"].strip()
-            username = row["Username"].strip()
-            domain = row["Domain"].strip()
-            upn = f"{username}@{domain}"
-            mail_nickname = username
-
-            try:
-                print(f"🔧 Onboarding: {full_name} ({upn})...")
-                user_id = create_user(full_name, upn, mail_nickname)
-                add_user_to_groups(user_id)
-                assign_license(user_id)
-                print(f"✅ Success: {full_name}\n")
-            except Exception as e:
-                print(f"❌ Failed: {full_name} — {e}\n")
+def process_csv(file_path, journal=None):
+    rows = read_csv(file_path, ONBOARD_COLUMNS)
+    since = metrics.snapshot()
+    journal = journal or JobJournal.create("onboard", file_path)
+    print(f"🗒️ Job {journal.job_id} (resume with --resume {journal.job_id})")
+    print(f"🔧 Onboarding in chunks of {CHUNK_SIZE} rows, $batch envelopes of up to {MAX_BATCH_SIZE} requests...")
+
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0, "rejected": 0}
+
+    def reject(line, reason):
+        counts["rejected"] += 1
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    # Bad rows are rejected before any network call; good rows go out in bounded chunks.
+    planner = Planner()
+    for chunk in chunked(ingest(rows, parse_onboard_row, reject), CHUNK_SIZE):
+        pending = [user for user in chunk if not journal.is_done(user["upn"], *STEPS)]
+        counts["skipped"] += len(chunk) - len(pending)
+        errors = onboard_chunk(pending, journal, planner)
+        for user in pending:
+            if errors[user["line"]]:
+                counts["failed"] += 1
+                print(f"❌ Failed: {user['name']} — {'; '.join(errors[user['line']])}")
+            else:
+                counts["succeeded"] += 1
+                print(f"✅ Success: {user['name']}")
+
+    summary = stats()
+    print(f"📊 {counts['succeeded']} onboarded, {counts['failed']} failed, "
+          f"{counts['skipped']} already done, {counts['rejected']} rejected")
+    print(f"📈 {summary['requests']} Graph calls, {summary['retries']} retries, "
+          f"{summary['throttle_seconds']:.1f}s waiting on throttling")
+    metrics.print_summary(since)
+    journal.close()
+    return counts
+
+def plan_csv(file_path):
+    # --dry-run: reads the directory and prints what a real run would change.
+    rows = read_csv(file_path, ONBOARD_COLUMNS)
+    requests_before = stats()["requests"]
+    print(f"🔍 Planning in chunks of {CHUNK_SIZE} rows (dry run, nothing is changed)...")
+    planned = {"create": 0, "enable": 0, "license": 0, "group_adds": 0, "in_sync": 0, "unreadable": 0}
+    planner = Planner()
+
+    def reject(line, reason):
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    for chunk in chunked(ingest(rows, parse_onboard_row, reject), CHUNK_SIZE):
+        plans, unreadable = planner.plan(chunk)
+        print_plan([user for user in chunk if user["line"] in plans], plans)
+        for user in chunk:
+            if user["line"] in unreadable:
+                print(f"❌ Could not plan {user['upn']}: {unreadable[user['line']]}")
+        for key, value in totals(plans.values()).items():
+            planned[key] += value
+        planned["unreadable"] += len(unreadable)
+        planner.done(plan["id"] for plan in plans.values() if plan["id"])
+
+    print(f"📋 Plan: {planned['create']} to create, {planned['enable']} to enable, {planned['license']} to license, "
+          f"{planned['group_adds']} group adds; {planned['in_sync']} already in sync, "
+          f"{planned['unreadable']} could not be read")
+    print(f"📈 {stats()['requests'] - requests_before} Graph calls to read current state")
+    return planned
 
 # === Run ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk onboard users from CSV")
+    parser.add_argument("csv", nargs="?", default="users.csv", help="CSV file to process")
+    parser.add_argument("--resume", metavar="JOB_ID", help="Resume a previous job, skipping finished steps")
+    parser.add_argument("--dry-run", action="store_true", help="Print the changes a run would make, then stop")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        plan_csv(args.csv)
+    elif args.resume:
+        journal = JobJournal.resume(args.resume)
+        if journal.kind != "onboard":
+            parser.error(f"Job {args.resume} is a {journal.kind} job")
+        process_csv(journal.source, journal)
+    else:
+        process_csv(args.csv)
+
 if __name__ == "__main__":
-    process_csv("users.csv")
+    main()
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from dotenv import load_dotenv
+from graph_client import stats
+from job_journal import JobJournal
+import metrics
+from csv_ingest import ONBOARD_COLUMNS, read_csv, ingest, chunked, check_upn, parse_onboard_row
+from planner import Planner
+from bulk_onboard import CHUNK_SIZE, onboard_chunk
+from bulk_offboard import lock_out_chunk, offboard_chunk
+
+load_dotenv()
+
+# === Load config ===
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# One row per employee: UPN and a 16-byte digest of their row in the last
+# export that was applied. 50k employees fit in a couple of MB.
+INDEX_FILE = os.getenv("HR_SYNC_INDEX") or os.path.join("logs", "hr_sync.sqlite")
+# A feed that would offboard more than this share of the index is refused
+# without --force: a truncated export must not lock out half the company.
+MAX_REMOVALS = float(CONFIG.get("hr_sync_max_removals", 0.05))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS employees (
+    upn TEXT PRIMARY KEY,
+    digest BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+def row_digest(row):
+    # Only the columns a sync applies count. A change to any other column
+    # (Platform, department) writes nothing, so it must not show as changed.
+    digest = hashlib.blake2b(digest_size=16)
+    for column in ONBOARD_COLUMNS:
+        digest.update((row.get(column) or "").strip().encode())
+        digest.update(b"\0")
+    return digest.digest()
+
+def parse_row(row):
+    return dict(parse_onboard_row(row), digest=row_digest(row))
+
+def row_upn(row):
+    # The UPN of a row that failed validation, if it still names one.
+    try:
+        return check_upn(f"{(row.get('Username') or '').strip()}@{(row.get('Domain') or '').strip()}")
+    except ValueError:
+        return None
+
+# === Snapshot index ===
+class SyncIndex:
+    def __init__(self, path=INDEX_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def count(self):
+        return self._db.execute("SELECT COUNT(*) FROM employees").fetchone()[0]
+
+    def stage(self, records, kept=()):
+        # Streams the new export into a temporary table; the diff is then three
+        # indexed joins instead of a replay of every row. kept holds the UPNs of
+        # rejected rows: they are still employees, so they are left as they are,
+        # never offboarded. It may be filled while records is consumed.
+        self._db.execute("DROP TABLE IF EXISTS temp.snapshot")
+        self._db.execute("DROP TABLE IF EXISTS temp.kept")
+        self._db.execute("CREATE TEMP TABLE snapshot (upn TEXT PRIMARY KEY, digest BLOB NOT NULL, line INTEGER NOT NULL)")
+        self._db.execute("CREATE TEMP TABLE kept (upn TEXT PRIMARY KEY)")
+        self._db.execute("BEGIN")
+        self._db.executemany("INSERT INTO snapshot VALUES (?, ?, ?)",
+                             ((record["upn"].lower(), record["digest"], record["line"]) for record in records))
+        self._db.executemany("INSERT OR IGNORE INTO kept VALUES (?)", [(upn.lower(),) for upn in kept])
+        self._db.execute("COMMIT")
+        return self._db.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+
+    def delta(self):
+        # Returns (lines of new rows, lines of changed rows, UPNs no longer in the export).
+        added = [line for line, in self._db.execute(
+            "SELECT s.line FROM snapshot s LEFT JOIN employees e ON e.upn = s.upn WHERE e.upn IS NULL ORDER BY s.line")]
+        changed = [line for line, in self._db.execute(
+            "SELECT s.line FROM snapshot s JOIN employees e ON e.upn = s.upn WHERE e.digest != s.digest ORDER BY s.line")]
+        removed = [upn for upn, in self._db.execute(
+            "SELECT e.upn FROM employees e WHERE NOT EXISTS (SELECT 1 FROM snapshot s WHERE s.upn = e.upn) "
+            "AND NOT EXISTS (SELECT 1 FROM kept k WHERE k.upn = e.upn) ORDER BY e.upn")]
+        return added, changed, removed
+
+    def accept_snapshot(self):
+        # --baseline: the staged export becomes the index as is.
+        self._db.execute("BEGIN")
+        self._db.execute("DELETE FROM employees WHERE upn NOT IN (SELECT upn FROM snapshot UNION SELECT upn FROM kept)")
+        self._db.execute("INSERT OR REPLACE INTO employees SELECT upn, digest FROM snapshot")
+        self._db.execute("COMMIT")
+
+    def record(self, records):
+        # Only rows that were applied are written, so a failed row shows up in the next delta again.
+        self._db.executemany("INSERT OR REPLACE INTO employees VALUES (?, ?)",
+                             [(record["upn"].lower(), record["digest"]) for record in records])
+
+    def forget(self, upns):
+        self._db.executemany("DELETE FROM employees WHERE upn = ?", [(upn.lower(),) for upn in upns])
+
+    def close(self):
+        self._db.close()
+
+# === Sync ===
+def sync_csv(file_path, dry_run=False, baseline=False, force=False, index=None):
+    since, started = metrics.snapshot(), time.monotonic()
+    index = index or SyncIndex()
+    counts = {"added": 0, "changed": 0, "removed": 0, "onboarded": 0, "offboarded": 0, "failed": 0, "rejected": 0,
+              "kept": 0}
+
+    def reject(line, reason):
+        counts["rejected"] += 1
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    # A rejected row that still names a UPN keeps that employee as they are.
+    kept = []
+
+    def parse(row):
+        try:
+            return parse_row(row)
+        except ValueError:
+            upn = row_upn(row)
+            if upn:
+                kept.append(upn)
+            raise
+
+    known = index.count()
+    total = index.stage(ingest(read_csv(file_path, ONBOARD_COLUMNS), parse, reject), kept)
+    added, changed, removed = index.delta()
+    counts.update(added=len(added), changed=len(changed), removed=len(removed), kept=len(kept))
+    print(f"🔍 {total} employees in export, {known} in the last snapshot: {len(added)} new, "
+          f"{len(changed)} changed, {len(removed)} gone ({time.monotonic() - started:.1f}s)")
+    if kept:
+        print(f"📌 {len(kept)} rejected rows left as they are until they are fixed")
+
+    if baseline:
+        index.accept_snapshot()
+        print("📌 Export recorded as the baseline; nothing was provisioned")
+        return counts
+    # Checked only before real writes: a dry run still lists the offboards, so
+    # they can be reviewed before choosing --force.
+    too_many = known and len(removed) > MAX_REMOVALS * known and not force
+    guard = (f"{len(removed)} offboards is more than {MAX_REMOVALS:.0%} of {known} employees; "
+             f"check the export or re-run with --force")
+
+    new_lines = set(added)
+    lines = new_lines | set(changed)
+
+    def delta_rows():
+        # A second streaming pass picks up just the rows in the delta.
+        for record in ingest(read_csv(file_path, ONBOARD_COLUMNS), parse_row, lambda line, reason: None):
+            if record["line"] in lines:
+                yield record
+
+    if dry_run:
+        for record in delta_rows():
+            print(f"📝 {'onboard' if record['line'] in new_lines else 'update'} {record['upn']}")
+        for upn in removed:
+            print(f"📝 offboard {upn}")
+        if too_many:
+            print(f"🛑 A real run would stop here: {guard}")
+        return counts
+
+    if too_many:
+        print(f"🛑 {guard}")
+        return counts
+    if not (added or changed or removed):
+        print("✅ Nothing to do")
+        return counts
+
+    journal = JobJournal.create("sync", file_path)
+    print(f"🗒️ Job {journal.job_id}")
+
+    # New and changed rows are reconciled by the bulk onboarding planner, so a
+    # changed row only writes what actually differs in the directory, its
+    # display name included.
+    planner = Planner(rename=True)
+    for chunk in chunked(delta_rows(), CHUNK_SIZE):
+        errors = onboard_chunk(chunk, journal, planner)
+        done = [record for record in chunk if not errors[record["line"]]]
+        index.record(done)
+        counts["onboarded"] += len(done)
+        for record in chunk:
+            if errors[record["line"]]:
+                counts["failed"] += 1
+                print(f"❌ Failed: {record['upn']} — {'; '.join(errors[record['line']])}")
+
+    # Employees missing from the export are locked out first, then cleaned up.
+    leavers = [{"upn": upn, "line": n} for n, upn in enumerate(removed, start=1)]
+    for chunk in chunked(leavers, CHUNK_SIZE):
+        errors = lock_out_chunk(chunk, journal)
+        cleanup_errors = offboard_chunk(chunk, journal)
+        done = [user["upn"] for user in chunk if not errors[user["line"]] and not cleanup_errors[user["line"]]]
+        index.forget(done)
+        counts["offboarded"] += len(done)
+        for user in chunk:
+            problems = errors[user["line"]] + cleanup_errors[user["line"]]
+            if problems:
+                counts["failed"] += 1
+                print(f"❌ Failed: {user['upn']} — {'; '.join(problems)}")
+
+    journal.close()
+    summary = stats()
+    print(f"📊 {counts['onboarded']} onboarded or updated, {counts['offboarded']} offboarded, "
+          f"{counts['failed']} failed, {counts['rejected']} rejected in {time.monotonic() - started:.1f}s")
+    print(f"📈 {summary['requests']} Graph calls, {summary['retries']} retries, "
+          f"{summary['throttle_seconds']:.1f}s waiting on throttling")
+    metrics.print_summary(since)
+    return counts
+
+# === Run ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply only what changed in an HR export since the last sync")
+    parser.add_argument("csv", nargs="?", default="hr_export.csv", help="Full HR export (onboarding CSV format)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the delta without changing anything")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Record this export as already applied, e.g. when adopting an existing directory")
+    parser.add_argument("--force", action="store_true", help="Apply even an unusually large number of offboards")
+    args = parser.parse_args(argv)
+    sync_csv(args.csv, dry_run=args.dry_run, baseline=args.baseline, force=args.force)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import time
+import queue
+import argparse
+import threading
+from dotenv import load_dotenv
+from graph_client import stats
+from job_journal import JobJournal
+import metrics
+import tenants
+from csv_ingest import (ONBOARD_COLUMNS, OFFBOARD_COLUMNS, read_csv, ingest,
+                        parse_onboard_row, parse_offboard_row)
+from planner import Planner
+import bulk_onboard
+import bulk_offboard
+
+load_dotenv()
+
+CHUNK_SIZE = bulk_onboard.CHUNK_SIZE
+# Chunks queued per shard before the CSV reader waits; keeps memory bounded
+# when one tenant is much slower than the others.
+SHARD_QUEUE_CHUNKS = 2
+
+MODES = {
+    "onboard": (ONBOARD_COLUMNS, parse_onboard_row),
+    "offboard": (OFFBOARD_COLUMNS, parse_offboard_row)
+}
+
+# === Shards ===
+# One thread per tenant, running the usual bulk chunk processors with that
+# tenant current. Graph limits apply per tenant, and so do the token, the
+# connection pool and the throttle window in graph_client, so shards do not
+# slow each other down.
+class Shard:
+    def __init__(self, tenant, mode, journal):
+        self.tenant = tenant
+        self.mode = mode
+        self.journal = journal
+        self.queue = queue.Queue(maxsize=SHARD_QUEUE_CHUNKS)
+        self.counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+        self.latencies = []
+        self.seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"shard-{tenant.name}", daemon=True)
+        self.thread.start()
+
+    def put(self, chunk):
+        self.queue.put(chunk)
+
+    def close(self):
+        self.queue.put(None)
+
+    def join(self):
+        self.thread.join()
+
+    def _chunks(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def _run(self):
+        started = time.monotonic()
+        with tenants.use(self.tenant):
+            if self.mode == "onboard":
+                self._onboard()
+            else:
+                self._offboard()
+        self.seconds = time.monotonic() - started
+
+    def _onboard(self):
+        planner = Planner()
+        for chunk in self._chunks():
+            pending = [user for user in chunk if not self.journal.is_done(user["upn"], *bulk_onboard.STEPS)]
+            self.counts["skipped"] += len(chunk) - len(pending)
+            errors = self._process(pending, lambda users: bulk_onboard.onboard_chunk(users, self.journal, planner))
+            self._report(pending, errors)
+
+    def _offboard(self):
+        # As in bulk_offboard, everyone in the shard is locked out before any
+        # cleanup starts; only UPNs are kept between the two passes.
+        locked = []
+        for chunk in self._chunks():
+            pending = [user for user in chunk if not self.journal.is_done(user["upn"], *bulk_offboard.LOCKOUT_STEPS)]
+            errors = self._process(pending, lambda users: bulk_offboard.lock_out_chunk(users, self.journal))
+            for user in pending:
+                if errors[user["line"]]:
+                    print(f"❌ Lock-out failed: {user['upn']} — {'; '.join(errors[user['line']])}")
+            locked.append(chunk)
+        for chunk in locked:
+            pending = [user for user in chunk if not self.journal.is_done(user["upn"], *bulk_offboard.STEPS)]
+            self.counts["skipped"] += len(chunk) - len(pending)
+            errors = self._process(pending, lambda users: bulk_offboard.offboard_chunk(users, self.journal))
+            self._report(pending, errors)
+
+    def _process(self, users, process):
+        # A chunk that raises fails its rows, not the shard: the reader must
+        # never block on a shard that has stopped taking chunks.
+        started = time.monotonic()
+        try:
+            errors = process(users)
+        except Exception as e:
+            errors = {user["line"]: [str(e)] for user in users}
+        self.latencies += [time.monotonic() - started] * len(users)
+        return errors
+
+    def _report(self, users, errors):
+        for user in users:
+            if errors[user["line"]]:
+                self.counts["failed"] += 1
+                print(f"❌ Failed: {user['upn']} — {'; '.join(errors[user['line']])}")
+            else:
+                self.counts["succeeded"] += 1
+                print(f"✅ Success: {user['upn']}")
+
+def run_shards(records, mode, journal, chunk_size=CHUNK_SIZE):
+    # Routes parsed rows to their tenant by UPN domain and returns
+    # {tenant name: Shard} once every shard has finished.
+    shards, pending = {}, {}
+    for record in records:
+        tenant = tenants.for_upn(record["upn"])
+        if tenant.name not in shards:
+            shards[tenant.name] = Shard(tenant, mode, journal)
+            pending[tenant.name] = []
+        batch = pending[tenant.name]
+        batch.append(record)
+        if len(batch) >= chunk_size:
+            shards[tenant.name].put(batch)
+            pending[tenant.name] = []
+    for name, shard in shards.items():
+        if pending[name]:
+            shard.put(pending[name])
+        shard.close()
+    for shard in shards.values():
+        shard.join()
+    return shards
+
+# === Bulk Processor ===
+def process_csv(file_path, mode="onboard", journal=None):
+    columns, parse = MODES[mode]
+    rows = read_csv(file_path, columns)
+    since, started = metrics.snapshot(), time.monotonic()
+    journal = journal or JobJournal.create(f"sharded-{mode}", file_path)
+    print(f"🗒️ Job {journal.job_id} (resume with --resume {journal.job_id})")
+    print(f"🏢 {mode.capitalize()} sharded by tenant: {len(tenants.TENANTS)} tenant profiles, "
+          f"chunks of {CHUNK_SIZE} rows")
+
+    rejected = 0
+
+    def reject(line, reason):
+        nonlocal rejected
+        rejected += 1
+        print(f"⚠️ Rejected line {line}: {reason}")
+
+    shards = run_shards(ingest(rows, parse, reject), mode, journal)
+
+    totals = {"succeeded": 0, "failed": 0, "skipped": 0}
+    for name, shard in shards.items():
+        for key in totals:
+            totals[key] += shard.counts[key]
+        print(f"🏢 {name}: {shard.counts['succeeded']} done, {shard.counts['failed']} failed, "
+              f"{shard.counts['skipped']} already done in {shard.seconds:.1f}s")
+    summary = stats()
+    print(f"📊 {totals['succeeded']} {mode}ed, {totals['failed']} failed, {totals['skipped']} already done, "
+          f"{rejected} rejected in {time.monotonic() - started:.1f}s")
+    print(f"📈 {summary['requests']} Graph calls, {summary['retries']} retries, "
+          f"{summary['throttle_seconds']:.1f}s waiting on throttling")
+    metrics.print_summary(since)
+    journal.close()
+    return dict(totals, rejected=rejected)
+
+# === Run ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk onboard or offboard across tenants, one shard per tenant")
+    parser.add_argument("csv", nargs="?", default="users.csv", help="CSV file to process")
+    parser.add_argument("--offboard", action="store_true", help="Offboard the UPNs in the file instead of onboarding")
+    parser.add_argument("--resume", metavar="JOB_ID", help="Resume a previous job, skipping finished steps")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        journal = JobJournal.resume(args.resume)
+        if not (journal.kind or "").startswith("sharded-"):
+            parser.error(f"Job {args.resume} is a {journal.kind} job")
+        process_csv(journal.source, journal.kind.split("-", 1)[1], journal)
+    else:
+        process_csv(args.csv, "offboard" if args.offboard else "onboard")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import re
+import csv
+import hashlib
+
+ONBOARD_COLUMNS = ("Full Name", "Username", "Domain")
+OFFBOARD_COLUMNS = ("UPN",)
+
+UPN_PATTERN = re.compile(r"^[A-Za-z0-9._%+'-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+$")
+
+PLATFORMS = ("azure", "google")
+# A blank Platform column has always meant Google Workspace.
+DEFAULT_PLATFORMS = ("google",)
+# Platforms in one cell are separated by ";", "," or "+", spaces allowed around them.
+PLATFORM_SEPARATORS = re.compile(r"\s*[;,+]\s*")
+
+# === Reading ===
+def check_columns(fieldnames, required_columns):
+    missing = [column for column in required_columns if column not in (fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+def check_header(file_path, required_columns):
+    with open(file_path, newline='', encoding='utf-8') as csvfile:
+        check_columns(csv.DictReader(csvfile).fieldnames, required_columns)
+
+def read_csv(file_path, required_columns):
+    # The header is checked up front; rows are then yielded one at a time so
+    # memory stays flat however big the file is.
+    csvfile = open(file_path, newline='', encoding='utf-8')
+    reader = csv.DictReader(csvfile)
+    try:
+        check_columns(reader.fieldnames, required_columns)
+    except ValueError:
+        csvfile.close()
+        raise
+    return stream_rows(csvfile, reader)
+
+def stream_rows(csvfile, reader):
+    with csvfile:
+        yield from reader
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# === Validation ===
+def check_upn(upn):
+    if not UPN_PATTERN.match(upn):
+        raise ValueError(f"invalid UPN '{upn}'")
+    return upn
+
+def parse_platforms(value):
+    # "azure;google", "azure+google" and "both" all target both platforms.
+    value = (value or "").strip().lower()
+    if value in ("both", "all"):
+        return list(PLATFORMS)
+    platforms = []
+    for platform in PLATFORM_SEPARATORS.split(value):
+        if not platform or platform in platforms:
+            continue
+        if platform not in PLATFORMS:
+            raise ValueError(f"unknown platform '{platform}'")
+        platforms.append(platform)
+    return platforms or list(DEFAULT_PLATFORMS)
+
+def parse_onboard_row(row):
+    name = (row.get("Full Name") or "").strip()
+    username = (row.get("Username") or "").strip()
+    domain = (row.get("Domain") or "").strip()
+    missing = [column for column, value in zip(ONBOARD_COLUMNS, (name, username, domain)) if not value]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    platforms = parse_platforms(row.get("Platform"))
+    return {
+        "name": name,
+        "username": username,
+        "domain": domain,
+        "upn": check_upn(f"{username}@{domain}"),
+        "mail_nickname": username,
+        "platforms": platforms,
+        "platform": ";".join(platforms)
+    }
+
+def parse_offboard_row(row):
+    upn = (row.get("UPN") or "").strip()
+    if not upn:
+        raise ValueError("missing UPN")
+    return {"upn": check_upn(upn)}
+
+# === Deduplication ===
+class SeenSet:
+    # Keeps an 8-byte digest per UPN instead of the string itself, which keeps
+    # 100k-row files to a few MB. UPNs are case-insensitive in both directories.
+    def __init__(self):
+        self._digests = set()
+
+    def add(self, upn):
+        digest = hashlib.blake2b(upn.lower().encode(), digest_size=8).digest()
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+def ingest(rows, parse, on_reject):
+    seen = SeenSet()
+    for line, row in enumerate(rows, start=2):
+        try:
+            record = parse(row)
+        except ValueError as e:
+            on_reject(line, str(e))
+            continue
+        if not seen.add(record["upn"]):
+            on_reject(line, f"duplicate UPN '{record['upn']}'")
+            continue
+        record["line"] = line
+        yield record
@@ -1,22 +1,42 @@
 import os
-import subprocess
-import csv
-from flask import Flask, render_template, redirect, url_for, request, session, flash
+import sys
+import hmac
+import json
+import uuid
+import time
+from flask import (Flask, Response, render_template, redirect, url_for, request, session, flash,
+                   jsonify, abort, stream_with_context)
 from functools import wraps
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 
 load_dotenv()
 
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BASE_DIR)
+
+from bulk_engine import CONFIG, onboard_user_row, run_bulk
+from csv_ingest import ONBOARD_COLUMNS, check_header, check_upn, read_csv, parse_onboard_row
+from jobs import FINISHED, JobQueue
+from lockout import LOCKOUT_PLATFORMS, lock_out_user
+from scheduler import scheduler
+from log_store import store as log_store, valid_cursor
+import metrics
+
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
-LOG_FILE = os.path.join(os.path.dirname(__file__), '..', 'logs', 'automation.log')
+LOG_PAGE_SIZE = 100
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 ADMIN_USER = os.getenv("ADMIN_USERNAME")
 ADMIN_PASS = os.getenv("ADMIN_PASSWORD")
+# /metrics needs a logged-in session, or "Authorization: Bearer <token>" when this is set (for scrapers).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+job_queue = JobQueue(workers=int(os.getenv("DASHBOARD_JOB_WORKERS") or CONFIG.get("dashboard_job_workers", 2)),
+                     scheduler=scheduler)
 
 def login_required(f):
     @wraps(f)
@@ -50,33 +70,106 @@ def logout():
 def index():
     return render_template('index.html')
 
-@app.route('/trigger/<script>')
+# === Background jobs ===
+def onboard_job(job, name, username, domain, platform):
+    job.set_total(1)
+    result = {"name": name, "email": f"{username}@{domain}", "platform": platform, "success": False}
+    try:
+        user = parse_onboard_row({"Full Name": name, "Username": username, "Domain": domain, "Platform": platform})
+        result["platform"] = user["platform"]
+        onboard_user_row(user, result)
+    except ValueError as e:
+        result["error"] = str(e)
+    job.add_result(result)
+    if not result["success"]:
+        raise Exception(result["error"])
+
+def offboard_job(job, upn, platforms):
+    job.set_total(1)
+    result = {"name": upn, "email": upn, "platform": ";".join(platforms), "success": False}
+    started = time.monotonic()
+    outcomes, _ = lock_out_user(upn, platforms)
+    # Done once the user is locked out everywhere; cleanup carries on in the background.
+    result["success"] = all(outcome["success"] for outcome in outcomes.values())
+    if not result["success"]:
+        result["error"] = "; ".join(f"{name}: {outcome['error']}" for name, outcome in outcomes.items()
+                                    if not outcome["success"])
+    result["seconds"] = round(time.monotonic() - started, 3)
+    job.add_result(result)
+    if not result["success"]:
+        raise Exception(result["error"])
+
+def bulk_job(job, path):
+    job.set_total(sum(1 for _ in read_csv(path, ONBOARD_COLUMNS)))
+    run_bulk(read_csv(path, ONBOARD_COLUMNS), on_result=job.add_result)
+
+def get_job_or_404(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+@app.route('/jobs/<job_id>')
 @login_required
-def trigger_script(script):
-    script_map = {
-        "azure_onboard": "azure_onboard.py",
-        "azure_offboard": "azure_offboard.py",
-        "google_onboard": "google_onboard.py",
-        "google_offboard": "google_offboard.py"
-    }
-
-    if script in script_map:
-        try:
-            subprocess.run(["python", script_map[script]], check=True)
-        except subprocess.CalledProcessError:
-            return f"❌ Failed to run {script}", 500
+def job_status(job_id):
+    return jsonify(get_job_or_404(job_id).snapshot())
 
-    return redirect(url_for('index'))
+@app.route('/jobs/<job_id>/events')
+@login_required
+def job_events(job_id):
+    job = get_job_or_404(job_id)
+
+    def stream():
+        # Each event carries the counters plus only the rows finished since the last one.
+        version, sent = -1, 0
+        while True:
+            version = job.wait_for_change(version, timeout=15)
+            snapshot = job.snapshot(since=sent)
+            sent += len(snapshot["results"])
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot["status"] in FINISHED:
+                break
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/jobs/<job_id>/progress')
+@login_required
+def job_progress(job_id):
+    return render_template("job.html", job=get_job_or_404(job_id).snapshot())
+
+@app.route('/jobs/<job_id>/results')
+@login_required
+def job_results(job_id):
+    return render_template("bulk_results.html", results=get_job_or_404(job_id).snapshot()["results"])
+
+@app.route('/metrics')
+def prometheus_metrics():
+    scraper = METRICS_TOKEN and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}")
+    if not scraper and "user" not in session:
+        abort(401)
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/logs')
 @login_required
 def view_logs():
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            lines = f.readlines()[-100:]
-    else:
-        lines = ["No logs available."]
-    return render_template('logs.html', logs=lines)
+    # Unfiltered pages come straight off the end of the log; filtered ones from
+    # the index. Either way a page costs the same however much history exists.
+    filters = {name: request.args.get(name, "").strip() for name in ("upn", "status", "since", "until")}
+    cursor = request.args.get("cursor") or None
+    if cursor and not valid_cursor(cursor, any(filters.values())):
+        flash("That page link is not valid; showing the newest entries instead.", "warning")
+        cursor = None
+    try:
+        if any(filters.values()):
+            entries, next_cursor = log_store.query(before=cursor, limit=LOG_PAGE_SIZE,
+                                                   **{name: value or None for name, value in filters.items()})
+        else:
+            entries, next_cursor = log_store.tail(LOG_PAGE_SIZE, cursor)
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "danger")
+        entries, next_cursor = [], None
+    return render_template('logs.html', entries=entries, filters=filters, next_cursor=next_cursor)
 
 @app.route('/manual-onboard', methods=['GET', 'POST'])
 @login_required
@@ -87,21 +180,33 @@ def manual_onboard():
         domain = request.form["domain"]
         platform = request.form["platform"]
 
-        script = "azure_onboard.py" if platform == "azure" else "google_onboard.py"
-        env = os.environ.copy()
-        env["ONBOARD_NAME"] = name
-        env["ONBOARD_USERNAME"] = username
-        env["ONBOARD_DOMAIN"] = domain
+        job = job_queue.submit("onboard", f"{username}@{domain}", onboard_job, name, username, domain, platform,
+                               lane="manual")
+        platforms = " + ".join(part.title() for part in platform.split(";"))
+        flash(f"⏳ Onboarding {username}@{domain} via {platforms} (job {job.id})", "info")
+        return redirect(url_for('job_progress', job_id=job.id))
+
+    return render_template("onboard.html", platform=request.args.get("platform"))
 
+@app.route('/offboard', methods=['GET', 'POST'])
+@login_required
+def offboard():
+    if request.method == "POST":
+        upn = request.form["upn"].strip()
+        platforms = [name for name in request.form.getlist("platforms") if name in LOCKOUT_PLATFORMS] or LOCKOUT_PLATFORMS
         try:
-            subprocess.run(["python", script], check=True, env=env)
-            flash(f"✅ Successfully onboarded {username}@{domain} via {platform.title()}", "success")
-        except subprocess.CalledProcessError:
-            flash("❌ Script failed. Check logs.", "danger")
+            check_upn(upn)
+        except ValueError as e:
+            flash(f"❌ {e}", "danger")
+            return redirect(url_for('offboard'))
 
-        return redirect(url_for('manual_onboard'))
+        # Offboards take the scheduler's top lane, ahead of any running bulk upload.
+        job = job_queue.submit("offboard", upn, offboard_job, upn, platforms, lane="offboard")
+        flash(f"🔒 Locking out {upn} (job {job.id})", "info")
+        return redirect(url_for('job_progress', job_id=job.id))
 
-    return render_template("onboard.html")
+    selected = [name for name in request.args.getlist("platform") if name in LOCKOUT_PLATFORMS] or LOCKOUT_PLATFORMS
+    return render_template("offboard.html", platforms=LOCKOUT_PLATFORMS, selected=selected)
 
 @app.route('/bulk-upload', methods=['GET', 'POST'])
 @login_required
@@ -112,31 +217,18 @@ def bulk_upload():
             flash("Please upload a valid CSV file.", "danger")
             return redirect(url_for('bulk_upload'))
 
-        path = os.path.join(UPLOAD_FOLDER, secure_filename(file.filename))
+        # Prefixed so concurrent uploads of the same file name don't overwrite each other.
+        path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex[:8]}-{secure_filename(file.filename)}")
         file.save(path)
 
-        results = []
-        with open(path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                name = row.get("Full Name")
-                username = row.get("Username")
-                domain = row.get("Domain")
-                platform = row.get("Platform", "").strip().lower()
-                email = f"{username}@{domain}"
-                script = "azure_onboard.py" if platform == "azure" else "google_onboard.py"
-                env = os.environ.copy()
-                env["ONBOARD_NAME"] = name
-                env["ONBOARD_USERNAME"] = username
-                env["ONBOARD_DOMAIN"] = domain
-
-                try:
-                    subprocess.run(["python", script], check=True, env=env)
-                    results.append({"name": name, "email": email, "platform": platform, "success": True})
-                except subprocess.CalledProcessError:
-                    results.append({"name": name, "email": email, "platform": platform, "success": False})
-
-        return render_template("bulk_results.html", results=results)
+        try:
+            check_header(path, ONBOARD_COLUMNS)
+        except ValueError as e:
+            flash(f"❌ {e}", "danger")
+            return redirect(url_for('bulk_upload'))
+
+        job = job_queue.submit("bulk", secure_filename(file.filename), bulk_job, path)
+        return redirect(url_for('job_progress', job_id=job.id))
 
     return render_template("bulk_upload.html")
 
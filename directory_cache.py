@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from metrics import register
+
+# Optional JSON file so lookups survive between runs, e.g. logs/.directory_cache.json
+CACHE_FILE = os.getenv("DIRECTORY_CACHE_FILE")
+MAX_ENTRIES = int(os.getenv("DIRECTORY_CACHE_SIZE", 50000))
+
+MISSING = object()
+
+# === TTL + LRU cache ===
+class TTLCache:
+    def __init__(self, name, ttl, maxsize=MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        key = key.lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key.lower()] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key.lower())
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key.lower(), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def dump(self):
+        now = time.time()
+        with self._lock:
+            return [[key, value, expires] for key, (value, expires) in self._entries.items() if expires > now]
+
+    def load(self, entries):
+        with self._lock:
+            for key, value, expires in entries:
+                self._entries[key] = (value, expires)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+# Object ids never change for a UPN; managers and memberships change more often.
+user_ids = TTLCache("user_id", ttl=24 * 3600)
+managers = TTLCache("manager", ttl=3600)
+memberships = TTLCache("member_of", ttl=300)
+
+CACHES = (user_ids, managers, memberships)
+
+for cache in CACHES:
+    register(f"cache_{cache.name}", cache.stats, counters=("hits", "misses"))
+
+# === Lookups ===
+async def cached(cache, key, loader):
+    value = cache.get(key)
+    if value is MISSING:
+        value = await loader()
+        cache.set(key, value)
+    return value
+
+def forget_user(upn=None, user_id=None):
+    # Call after writes that change what a lookup would return.
+    if upn:
+        managers.invalidate(upn)
+    if user_id:
+        memberships.invalidate(user_id)
+
+def stats():
+    return {cache.name: cache.stats() for cache in CACHES}
+
+def clear():
+    for cache in CACHES:
+        cache.clear()
+
+# === Persistence ===
+def load(path=CACHE_FILE):
+    if not path or not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for cache in CACHES:
+        cache.load(data.get(cache.name, []))
+
+def save(path=CACHE_FILE):
+    if not path:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({cache.name: cache.dump() for cache in CACHES}, f)
+
+if CACHE_FILE:
+    load()
+    atexit.register(save)
@@ -1,44 +1,44 @@
 # email_notify.py
-import requests
 import os
-from msal import ConfidentialClientApplication
+import json
+import time
+import queue
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
 from dotenv import load_dotenv
+from graph_client import run
+from graph_batch import MAX_BATCH_SIZE, batch_request, send_envelopes_async, is_success, error_message
+from email_templates import render_template
+from metrics import observe, register
 
 load_dotenv()
 
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 SENDER = os.getenv("SENDER_ADDRESS")  # e.g., admin@example.com
 
-AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
-SCOPE = ["https://graph.microsoft.com/.default"]
-
-app = ConfidentialClientApplication(
-    client_id=CLIENT_ID,
-    client_credential=CLIENT_SECRET,
-    authority=AUTHORITY
-)
-
-token = app.acquire_token_for_client(scopes=SCOPE)
-if "access_token" not in token:
-    raise Exception("Authentication failed.")
-
-headers = {
-    "Authorization": f"Bearer {token['access_token']}",
-    "Content-Type": "application/json"
-}
-
-def render_template(path, replacements):
-    with open(path, "r", encoding="utf-8") as file:
-        content = file.read()
-        for key, value in replacements.items():
-            content = content.replace(f"{{{{{key}}}}}", value)
-        return content
-
-def send_email(recipient, subject, html_body):
-    url = f"https://graph.microsoft.com/v1.0/users/{SENDER}/sendMail"
-    payload = {
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Mail waits this long for company before a $batch goes out, and at most this
+# many $batch envelopes are in flight at once.
+MAIL_LINGER = float(CONFIG.get("mail_linger_seconds", 0.2))
+MAIL_MAX_ENVELOPES = int(os.getenv("MAIL_MAX_ENVELOPES") or CONFIG.get("mail_max_envelopes", 4))
+# A digest never holds a run's mail longer than this; after that, what it holds
+# is merged and sent, and holding starts again. Bounds both the delay and what
+# a crash can lose.
+MAIL_DIGEST_MAX_HOLD = float(CONFIG.get("mail_digest_max_seconds", 300))
+
+# The digest of the run that is sending, if any. A context variable, so only
+# mail sent on behalf of that run is held; a manual onboard's welcome mail or
+# an exit notice sent meanwhile goes out straight away.
+_current_digest = contextvars.ContextVar("mail_digest", default=None)
+
+def mail_payload(recipient, subject, html_body):
+    return {
         "message": {
             "subject": subject,
             "body": {
@@ -54,5 +54,173 @@ def send_email(recipient, subject, html_body):
             ]
         }
     }
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
+
+def merge_bodies(html_bodies):
+    # Keeps the first document's head and styles and stacks every <body> inside it.
+    parts = [html.split("<body>", 1)[-1].rsplit("</body>", 1)[0] for html in html_bodies]
+    if "<body>" not in html_bodies[0]:
+        return "<hr>".join(parts)
+    head = html_bodies[0].split("<body>", 1)[0]
+    return f"{head}<body>{'<hr>'.join(parts)}</body>\n</html>"
+
+# === Mail queue ===
+# send_email only enqueues. A worker thread packs queued mail into Graph $batch
+# envelopes of up to 20 sendMail calls over the shared keep-alive client.
+# Mail sent inside a digest() block is held for that run, and each recipient
+# gets one message.
+class MailQueue:
+    def __init__(self, linger=MAIL_LINGER, max_envelopes=MAIL_MAX_ENVELOPES, max_hold=MAIL_DIGEST_MAX_HOLD):
+        self.linger = linger
+        self.max_envelopes = max_envelopes
+        self.max_hold = max_hold
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # {digest key: (held since, {recipient: [items]})}, one per open digest.
+        self._held = {}
+        self._metrics = {"queued": 0, "sent": 0, "failed": 0, "merged": 0, "api_calls": 0,
+                         "latency_seconds": 0.0, "max_latency_seconds": 0.0}
+
+    def send(self, recipient, subject, html_body, digest=None):
+        future = Future()
+        item = (recipient, subject, html_body, future, time.monotonic())
+        digest = digest or _current_digest.get()
+        released = {}
+        with self._lock:
+            self._metrics["queued"] += 1
+            if digest in self._held:
+                since, held = self._held[digest]
+                held.setdefault(recipient.lower(), []).append(item)
+                if time.monotonic() - since < self.max_hold:
+                    return future
+                released = held
+                self._held[digest] = (time.monotonic(), {})
+        for items in released.values():
+            self._queue_merged(items)
+        if not released:
+            self._start()
+            self._queue.put(item)
+        return future
+
+    @contextmanager
+    def digest(self):
+        # Yields the run's digest key; mail sent in this context, or with the
+        # key passed explicitly, is held and merged per recipient.
+        digest = object()
+        with self._lock:
+            self._held[digest] = (time.monotonic(), {})
+        token = _current_digest.set(digest)
+        try:
+            yield digest
+        finally:
+            _current_digest.reset(token)
+            with self._lock:
+                _, held = self._held.pop(digest)
+            for items in held.values():
+                self._queue_merged(items)
+
+    def flush(self):
+        # Blocks until everything queued so far has been sent (or failed).
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = self._queue.qsize() + sum(len(items) for _, held in self._held.values()
+                                                                for items in held.values())
+        delivered = metrics["sent"] + metrics["failed"]
+        metrics["avg_latency_seconds"] = round(metrics.pop("latency_seconds") / delivered, 3) if delivered else 0.0
+        metrics["max_latency_seconds"] = round(metrics["max_latency_seconds"], 3)
+        return metrics
+
+    def _queue_merged(self, items):
+        if len(items) == 1:
+            self._start()
+            self._queue.put(items[0])
+            return
+        recipient, subject = items[0][0], items[0][1]
+        merged = Future()
+        merged.add_done_callback(lambda done: [_copy_result(done, item[3]) for item in items])
+        with self._lock:
+            self._metrics["merged"] += len(items) - 1
+        self._start()
+        self._queue.put((recipient, f"{subject} (+{len(items) - 1} more)",
+                         merge_bodies([item[2] for item in items]), merged, items[0][4]))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="mail-queue", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < MAX_BATCH_SIZE * self.max_envelopes and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._send([item for item in batch if not isinstance(item, threading.Event)])
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _send(self, items):
+        if not items:
+            return
+        calls = [batch_request(str(n), "POST", f"/users/{SENDER}/sendMail", body=mail_payload(*item[:3]))
+                 for n, item in enumerate(items)]
+        envelopes = [calls[start:start + MAX_BATCH_SIZE] for start in range(0, len(calls), MAX_BATCH_SIZE)]
+        try:
+            responses = {}
+            for result in run(send_envelopes_async(envelopes)):
+                responses.update(result)
+        except Exception as e:
+            responses = {str(n): {"status": 0, "body": {"error": {"message": str(e)}}} for n in range(len(items))}
+
+        now = time.monotonic()
+        results = [responses.get(str(n)) for n in range(len(items))]
+        with self._lock:
+            self._metrics["api_calls"] += len(envelopes)
+            for item, response in zip(items, results):
+                latency = now - item[4]
+                self._metrics["latency_seconds"] += latency
+                self._metrics["max_latency_seconds"] = max(self._metrics["max_latency_seconds"], latency)
+                self._metrics["sent" if is_success(response) else "failed"] += 1
+                observe("send_email", latency, None if is_success(response) else str((response or {}).get("status", 0)))
+
+        for (recipient, _, _, future, _), response in zip(items, results):
+            if is_success(response):
+                future.set_result(None)
+            else:
+                print(f"❌ Email to {recipient} failed: {error_message(response)}")
+                future.set_exception(RuntimeError(error_message(response)))
+
+def _copy_result(source, target):
+    if source.exception():
+        target.set_exception(source.exception())
+    else:
+        target.set_result(None)
+
+mail_queue = MailQueue()
+register("mail", mail_queue.stats, counters=("queued", "sent", "failed", "merged", "api_calls"))
+
+def send_email(recipient, subject, html_body, digest=None):
+    # Returns a Future; call .result() to wait for delivery.
+    return mail_queue.send(recipient, subject, html_body, digest)
+
+def mail_digest():
+    return mail_queue.digest()
+
+def flush():
+    mail_queue.flush()
+
+def stats():
+    return mail_queue.stats()
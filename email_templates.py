@@ -0,0 +1,50 @@
+import os
+import re
+import threading
+from html import escape
+
+# {{ name }} placeholders; whitespace inside the braces is allowed.
+PLACEHOLDER = re.compile(r"(\{\{\s*(\w+)\s*\}\})")
+
+# === Compiled template ===
+class CompiledTemplate:
+    # The source is split once into literal text and placeholders, so a render
+    # is a single join over the segments instead of one replace per key.
+    def __init__(self, source):
+        parts = PLACEHOLDER.split(source)
+        self.literals = parts[0::3]
+        self.placeholders = list(zip(parts[1::3], parts[2::3]))
+
+    def render(self, values):
+        out = [self.literals[0]]
+        for (raw, name), literal in zip(self.placeholders, self.literals[1:]):
+            if name in values:
+                value = values[name]
+                out.append("" if value is None else escape(str(value)))
+            else:
+                # Unknown keys are left as written, as str.replace would.
+                out.append(raw)
+            out.append(literal)
+        return "".join(out)
+
+# === Cache ===
+# Keyed by path; the mtime is checked on each lookup so edited templates are
+# picked up without a restart.
+_lock = threading.Lock()
+_cache = {}
+
+def load_template(path):
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        entry = _cache.get(path)
+        if entry and entry[0] == mtime:
+            return entry[1]
+    with open(path, "r", encoding="utf-8") as file:
+        template = CompiledTemplate(file.read())
+    with _lock:
+        _cache[path] = (mtime, template)
+    return template
+
+def render_template(path, replacements):
+    return load_template(path).render(replacements)
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import threading
+from throttle import THROTTLE_STATUSES, MAX_RETRIES, backoff_delay, is_idempotent, should_retry
+from metrics import timed, register
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Relative paths in config.json are relative to this directory, not the working one.
+SERVICE_ACCOUNT_FILE = os.path.join(BASE_DIR, CONFIG["google_service_account_file"])
+DELEGATED_ADMIN = CONFIG["google_delegated_admin"]
+
+# Point this at a local fake Directory API to exercise the code offline.
+API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+SCOPES = [
+    "https://www.googleapis.com/auth/admin.directory.user",
+    "https://www.googleapis.com/auth/admin.directory.group"
+]
+
+# The Directory API accepts up to 1,000 calls per batch request.
+MAX_BATCH_SIZE = 1000
+
+# Google answers quota errors with 403 and one of these reasons, not only 429.
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+STATS = {"requests": 0, "retries": 0, "throttled": 0, "throttle_seconds": 0.0, "errors": 0}
+
+register("google", lambda: STATS, counters=STATS)
+
+# === Service ===
+_lock = threading.Lock()
+_local = threading.local()
+_credentials = None
+_service = None
+
+def get_credentials():
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            from google.oauth2 import service_account
+            creds = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+            _credentials = creds.with_subject(DELEGATED_ADMIN)
+        return _credentials
+
+def get_service():
+    # Built once per process, on first use. static_discovery uses the discovery
+    # document bundled with google-api-python-client instead of fetching it.
+    global _service
+    credentials = get_credentials()
+    with _lock:
+        if _service is None:
+            from googleapiclient.discovery import build
+            _service = build("admin", "directory_v1", credentials=credentials,
+                             static_discovery=True, cache_discovery=False,
+                             client_options={"api_endpoint": API_ENDPOINT} if API_ENDPOINT else None)
+        return _service
+
+def get_http():
+    # httplib2 connections are not thread-safe, so each thread executes over
+    # its own, all signed with the one set of credentials.
+    http = getattr(_local, "http", None)
+    if http is None:
+        import google_auth_httplib2
+        from googleapiclient.http import build_http
+        http = _local.http = google_auth_httplib2.AuthorizedHttp(get_credentials(), http=build_http())
+    return http
+
+def is_throttled(error):
+    from googleapiclient.errors import HttpError
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status in THROTTLE_STATUSES:
+        return True
+    if error.resp.status != 403:
+        return False
+    try:
+        errors = json.loads(error.content)["error"].get("errors", [])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+    return any(item.get("reason") in RATE_LIMIT_REASONS for item in errors)
+
+def is_retryable(error, method):
+    # As for Graph: inserts and other writes are resent only when Google says
+    # it did not process them; reads also on 5xx and dropped connections.
+    from googleapiclient.errors import HttpError
+    if is_throttled(error):
+        return True
+    if isinstance(error, HttpError):
+        return should_retry(error.resp.status, is_idempotent(method))
+    return isinstance(error, (OSError, TimeoutError)) and is_idempotent(method)
+
+def wait_before_retry(error, attempt):
+    retry_after = error.resp.get("retry-after") if hasattr(error, "resp") else None
+    delay = backoff_delay(attempt, retry_after)
+    if is_throttled(error):
+        STATS["throttled"] += 1
+        STATS["throttle_seconds"] += delay
+    STATS["retries"] += 1
+    return delay
+
+def execute(request):
+    # Runs one request built from get_service() on the calling thread's connection.
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = request.execute(http=get_http())
+            STATS["requests"] += 1
+            return response
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e, request.method):
+                STATS["errors"] += 1
+                raise
+            time.sleep(wait_before_retry(e, attempt))
+
+# === Batching ===
+@timed("google_batch")
+def run_batch(requests, on_result):
+    # requests is a list of (request_id, HttpRequest). on_result(request_id,
+    # response, error) is called once per request; throttled items are retried.
+    from googleapiclient.errors import HttpError
+    for start in range(0, len(requests), MAX_BATCH_SIZE):
+        pending = dict(requests[start:start + MAX_BATCH_SIZE])
+        for attempt in range(MAX_RETRIES + 1):
+            retry = {}
+            delays = []
+            answered = set()
+
+            def callback(request_id, response, exception):
+                STATS["requests"] += 1
+                if (isinstance(exception, HttpError) and attempt < MAX_RETRIES
+                        and is_retryable(exception, pending[request_id].method)):
+                    retry[request_id] = pending[request_id]
+                    delays.append(wait_before_retry(exception, attempt))
+                else:
+                    if exception is not None:
+                        STATS["errors"] += 1
+                    answered.add(request_id)
+                    on_result(request_id, response, exception)
+
+            batch = new_batch(callback)
+            for request_id, request in pending.items():
+                batch.add(request, request_id=request_id)
+            try:
+                batch.execute(http=get_http())
+            except Exception as e:
+                # The whole envelope failed, so every request in it without an
+                # answer yet failed with it.
+                for request_id in pending:
+                    if request_id not in answered:
+                        STATS["errors"] += 1
+                        on_result(request_id, None, e)
+                break
+
+            if not retry:
+                break
+            time.sleep(max(delays))
+            pending = retry
+
+def new_batch(callback):
+    # The service's batch URI ignores api_endpoint, so it is set explicitly here.
+    if API_ENDPOINT:
+        from googleapiclient.http import BatchHttpRequest
+        return BatchHttpRequest(callback=callback, batch_uri=f"{API_ENDPOINT.rstrip('/')}/batch")
+    return get_service().new_batch_http_request(callback=callback)
+
+def error_message(error):
+    from googleapiclient.errors import HttpError
+    if isinstance(error, HttpError):
+        return f"HTTP {error.resp.status}: {error.reason}"
+    return str(error)
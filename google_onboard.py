@@ -1,49 +1,46 @@
 import json
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from dotenv import load_dotenv
 from notifier import notify_all
+from google_directory import get_service, execute
+from metrics import timed
 import os
 
 load_dotenv()
 
-with open("config.json") as f:
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
     CONFIG = json.load(f)
 
-SERVICE_ACCOUNT_FILE = CONFIG["google_service_account_file"]
-DELEGATED_ADMIN = CONFIG["google_delegated_admin"]
 DOMAIN = CONFIG["google_domain"]
 ORG_UNIT = CONFIG["google_org_unit"]
 PASSWORD = CONFIG["default_password"]
 
-SCOPES = [
-    "https://www.googleapis.com/auth/admin.directory.user",
-    "https://www.googleapis.com/auth/admin.directory.group"
-]
-
-creds = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-delegated_creds = creds.with_subject(DELEGATED_ADMIN)
-
-service = build("admin", "directory_v1", credentials=delegated_creds)
-
-def create_google_user(full_name, username):
-    email = f"{username}@{DOMAIN}"
-    user_info = {
+def user_body(full_name, username):
+    return {
         "name": {
             "givenName": full_name.split()[0],
             "familyName": full_name.split()[-1]
         },
         "password": PASSWORD,
-        "primaryEmail": email,
+        "primaryEmail": f"{username}@{DOMAIN}",
         "orgUnitPath": ORG_UNIT
     }
 
-    service.users().insert(body=user_info).execute()
+@timed("create_google_user")
+def create_google_user(full_name, username):
+    user_info = user_body(full_name, username)
+    email = user_info["primaryEmail"]
+
+    execute(get_service().users().insert(body=user_info))
     print(f"✅ Google Workspace user created: {email}")
     notify_all(f"✅ GWS user onboarded: *{full_name}* ({email})")
+    return email
 
-if __name__ == "__main__":
+def main():
     full_name = os.getenv("ONBOARD_NAME") or input("Enter full name: ")
     username = os.getenv("ONBOARD_USERNAME") or input("Enter username (without domain): ")
     create_google_user(full_name, username)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === Auth config ===
+TENANT_ID = os.getenv("TENANT_ID")
+CLIENT_ID = os.getenv("CLIENT_ID")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+SCOPE = ["https://graph.microsoft.com/.default"]
+
+# Optional on-disk MSAL cache so separate runs can reuse a still-valid token.
+TOKEN_CACHE_FILE = os.getenv("GRAPH_TOKEN_CACHE")
+# Tokens are refreshed this many seconds before they expire.
+REFRESH_MARGIN = int(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN", 300))
+
+# === Token provider ===
+class TokenProvider:
+    def __init__(self, tenant_id, client_id, client_secret, cache_file=None):
+        self.authority = f"https://login.microsoftonline.com/{tenant_id}"
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._app = None
+        self._cache = None
+        self._token = None
+        self._expires_at = 0
+
+    def _build_app(self):
+        # msal is slow to import, so it is only loaded once a token is needed.
+        from msal import ConfidentialClientApplication, SerializableTokenCache
+        self._cache = SerializableTokenCache()
+        if self.cache_file and os.path.exists(self.cache_file):
+            with open(self.cache_file) as f:
+                self._cache.deserialize(f.read())
+        return ConfidentialClientApplication(
+            client_id=self.client_id,
+            client_credential=self.client_secret,
+            authority=self.authority,
+            token_cache=self._cache
+        )
+
+    def _save_cache(self):
+        if self.cache_file and self._cache.has_state_changed:
+            with open(self.cache_file, "w") as f:
+                f.write(self._cache.serialize())
+            os.chmod(self.cache_file, 0o600)
+
+    def get_token(self):
+        with self._lock:
+            if self._token and time.time() < self._expires_at - REFRESH_MARGIN:
+                return self._token
+
+            if self._app is None:
+                self._app = self._build_app()
+
+            token = self._app.acquire_token_for_client(scopes=SCOPE)
+            if "access_token" not in token:
+                raise Exception("Authentication failed.")
+
+            self._token = token["access_token"]
+            self._expires_at = time.time() + int(token.get("expires_in", 3599))
+            self._save_cache()
+            return self._token
+
+    def cached_token(self):
+        # Lock-free read for the event loop; None once a refresh is due.
+        token, expires_at = self._token, self._expires_at
+        return token if token and time.time() < expires_at - REFRESH_MARGIN else None
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0
+
+provider = TokenProvider(TENANT_ID, CLIENT_ID, CLIENT_SECRET, TOKEN_CACHE_FILE)
+
+def bearer_headers(token):
+    return {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
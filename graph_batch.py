@@ -0,0 +1,106 @@
+import asyncio
+from graph_client import GRAPH_URL, STATS, request, run, get_limit
+from throttle import THROTTLE_STATUSES, MAX_RETRIES, backoff_delay, is_idempotent, should_retry
+from metrics import timed
+
+MAX_BATCH_SIZE = 20
+
+# === Request builders ===
+def batch_request(request_id, method, url, body=None, depends_on=None):
+    item = {"id": request_id, "method": method, "url": url}
+    if body is not None:
+        item["body"] = body
+        item["headers"] = {"Content-Type": "application/json"}
+    if depends_on:
+        item["dependsOn"] = depends_on
+    return item
+
+# === Envelope sending ===
+def retryable_requests(batch, responses):
+    status = {item["id"]: responses.get(item["id"], {}).get("status") for item in batch}
+    # Writes are resent only when throttled; a 5xx may already have applied them.
+    retry_ids = {item["id"] for item in batch if should_retry(status[item["id"]], is_idempotent(item["method"]))}
+    # A 424 only means a dependency failed; resend it if that dependency is being retried.
+    for item in batch:
+        if status[item["id"]] == 424 and retry_ids.intersection(item.get("dependsOn", [])):
+            retry_ids.add(item["id"])
+
+    retry = []
+    for item in batch:
+        if item["id"] in retry_ids:
+            item = dict(item)
+            depends_on = [request_id for request_id in item.pop("dependsOn", []) if request_id in retry_ids]
+            if depends_on:
+                item["dependsOn"] = depends_on
+            retry.append(item)
+    return retry
+
+@timed("graph_batch")
+async def send_batch_async(batch):
+    responses = {}
+    pending = batch
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            # An envelope of reads can be resent on any failure; one with writes
+            # only when Graph says it was not processed.
+            r = await request("POST", "/$batch", json={"requests": pending},
+                              idempotent=all(is_idempotent(item["method"]) for item in pending))
+            r.raise_for_status()
+        except Exception as e:
+            # The whole envelope failed, so every sub-request in it failed.
+            responses.update({item["id"]: {"id": item["id"], "status": 0, "body": {"error": {"message": str(e)}}}
+                              for item in pending})
+            return responses
+
+        # Graph throttles sub-requests individually inside a successful envelope.
+        results = {item["id"]: item for item in r.json()["responses"]}
+        responses.update(results)
+        pending = retryable_requests(pending, results)
+        if not pending or attempt == MAX_RETRIES:
+            return responses
+
+        throttled = [results[item["id"]] for item in pending if results[item["id"]].get("status") in THROTTLE_STATUSES]
+        delay = max(backoff_delay(attempt, (result.get("headers") or {}).get("Retry-After")) for result in throttled or [{}])
+        if throttled:
+            get_limit().on_throttle()
+            STATS["throttled"] += len(throttled)
+            STATS["throttle_seconds"] += delay
+        STATS["retries"] += len(pending)
+        await asyncio.sleep(delay)
+    return responses
+
+async def send_envelopes_async(envelopes):
+    # Envelopes are independent, so they go out concurrently under the tenant limit.
+    return await asyncio.gather(*(send_batch_async(envelope) for envelope in envelopes if envelope))
+
+def run_batch(request_groups):
+    # Each group holds the requests for one CSV row. A group is never split
+    # across envelopes because dependsOn only works inside a single $batch.
+    envelopes = [[]]
+    for group in request_groups:
+        if len(group) > MAX_BATCH_SIZE:
+            raise ValueError(f"Request group of {len(group)} exceeds the $batch limit of {MAX_BATCH_SIZE}")
+        if len(envelopes[-1]) + len(group) > MAX_BATCH_SIZE:
+            envelopes.append([])
+        envelopes[-1].extend(group)
+
+    responses = {}
+    for result in run(send_envelopes_async(envelopes)):
+        responses.update(result)
+    return responses
+
+# === Response helpers ===
+def is_success(response):
+    return response is not None and 200 <= response["status"] < 300
+
+def is_conflict(response):
+    # Graph answers 400 "... already exist(s)" when a create or member add was done before.
+    return response is not None and response["status"] == 400 and "already exist" in error_message(response)
+
+def error_message(response):
+    if response is None:
+        return "no response"
+    body = response.get("body") or {}
+    if isinstance(body, dict) and "error" in body:
+        return body["error"].get("message") or f"HTTP {response['status']}"
+    return f"HTTP {response['status']}"
@@ -0,0 +1,145 @@
+import os
+import json
+import asyncio
+import threading
+from dotenv import load_dotenv
+from graph_auth import bearer_headers
+from throttle import THROTTLE_STATUSES, MAX_RETRIES, AdaptiveLimiter, backoff_delay, is_idempotent, should_retry
+from metrics import register
+import tenants
+
+load_dotenv()
+
+# Point this at a local fake Graph server to exercise the code offline.
+GRAPH_URL = os.getenv("GRAPH_BASE_URL", "https://graph.microsoft.com/v1.0").rstrip("/")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Graph throttles per tenant, so parallel calls are capped per tenant too. The
+# cap is the ceiling of an adaptive window that shrinks on 429/503. A tenant
+# profile's graph_max_concurrency overrides it for that tenant.
+MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY") or CONFIG.get("graph_max_concurrency", 10))
+
+# memberOf pages are capped at 100 by default; ask for the maximum and only the id.
+MEMBER_OF_PARAMS = {"$select": "id", "$top": "999"}
+
+# === Event loop ===
+# A single background loop owns the HTTP/2 keep-alive pools, so sync callers on
+# any thread (CLI, dashboard workers) share the same connections. Each tenant
+# has its own pool and throttle window, keyed by tenant id, so one tenant
+# being throttled never slows another.
+_lock = threading.Lock()
+_loop = None
+_clients = {}
+_limits = {}
+
+STATS = {"requests": 0, "retries": 0, "throttled": 0, "throttle_seconds": 0.0, "errors": 0}
+
+def get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="graph-client", daemon=True).start()
+        return _loop
+
+def run(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+def max_concurrency(tenant):
+    return int(tenant.overrides.get("graph_max_concurrency", MAX_CONCURRENCY))
+
+def get_client(tenant=None):
+    tenant = tenant or tenants.current()
+    if tenant.tenant_id not in _clients:
+        import httpx
+        connections = max_concurrency(tenant)
+        _clients[tenant.tenant_id] = httpx.AsyncClient(
+            base_url=GRAPH_URL,
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        )
+    return _clients[tenant.tenant_id]
+
+def get_limit(tenant=None):
+    tenant = tenant or tenants.current()
+    if tenant.tenant_id not in _limits:
+        _limits[tenant.tenant_id] = AdaptiveLimiter(max_concurrency(tenant))
+    return _limits[tenant.tenant_id]
+
+def stats():
+    return dict(STATS, concurrency={tenant: limit.limit for tenant, limit in _limits.items()})
+
+register("graph", lambda: STATS, counters=STATS)
+
+# === Requests ===
+async def get_token_async(token_provider):
+    # MSAL blocks on the network, so a refresh runs on a worker thread and the
+    # loop keeps serving every other call, and every other tenant, meanwhile.
+    token = token_provider.cached_token()
+    if token is None:
+        token = await asyncio.get_running_loop().run_in_executor(None, token_provider.get_token)
+    return token
+
+async def request(method, path, idempotent=None, **kwargs):
+    # idempotent overrides the method's default, e.g. for a $batch of reads.
+    import httpx
+    idempotent = is_idempotent(method) if idempotent is None else idempotent
+    tenant = tenants.current()
+    limit = get_limit(tenant)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            headers = bearer_headers(await get_token_async(tenant.provider))
+            async with limit:
+                response = await get_client(tenant).request(method, path, headers=headers, **kwargs)
+        except httpx.TransportError as e:
+            # A failed connect never reached Graph; any later failure might have.
+            sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+            if attempt == MAX_RETRIES or (sent and not idempotent):
+                STATS["errors"] += 1
+                raise
+            STATS["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        STATS["requests"] += 1
+
+        if response.status_code == 401 and attempt == 0 and MAX_RETRIES > 0:
+            # Token revoked or expired early: fetch a fresh one and retry once.
+            tenant.provider.invalidate()
+            STATS["retries"] += 1
+            continue
+
+        if not should_retry(response.status_code, idempotent) or attempt == MAX_RETRIES:
+            if response.status_code < 400:
+                limit.on_success()
+            else:
+                STATS["errors"] += 1
+            return response
+
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        if response.status_code in THROTTLE_STATUSES:
+            limit.on_throttle()
+            STATS["throttled"] += 1
+            STATS["throttle_seconds"] += delay
+        STATS["retries"] += 1
+        await asyncio.sleep(delay)
+
+async def paginate(path, params=None):
+    # Follows @odata.nextLink until the collection is exhausted. The link already
+    # carries the original query, so params only go on the first request.
+    url = path
+    while url:
+        r = await request("GET", url, params=params)
+        r.raise_for_status()
+        page = r.json()
+        for item in page.get("value", []):
+            yield item
+        url = page.get("@odata.nextLink")
+        params = None
+
+async def list_all(path, params=None):
+    return [item async for item in paginate(path, params)]
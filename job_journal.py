@@ -0,0 +1,85 @@
+import os
+import json
+import uuid
+import datetime
+import threading
+
+JOBS_DIR = os.path.join("logs", "jobs")
+
+# === Job Journal ===
+# Append-only JSONL: a header line describing the job, then one line per
+# completed step per row. Replaying it tells a resumed run what to skip.
+class JobJournal:
+    def __init__(self, job_id, kind=None, source=None):
+        self.job_id = job_id
+        self.path = os.path.join(JOBS_DIR, f"{job_id}.jsonl")
+        self.kind = kind
+        self.source = source
+        self.completed = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            self._replay()
+        elif kind is None:
+            raise FileNotFoundError(f"No journal found for job {job_id}")
+
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._torn_tail():
+            # End the torn line so the next record starts on a line of its own.
+            self._file.write("\n")
+            self._file.flush()
+        if not os.path.getsize(self.path):
+            self._write({"job": job_id, "kind": kind, "source": source,
+                         "started": datetime.datetime.now().isoformat(timespec="seconds")})
+
+    @classmethod
+    def create(cls, kind, source):
+        job_id = f"{kind}-{datetime.datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        return cls(job_id, kind, source)
+
+    @classmethod
+    def resume(cls, job_id):
+        return cls(job_id)
+
+    def _replay(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave a torn last line; everything before it is valid.
+                    continue
+                if "job" in entry:
+                    self.kind = self.kind or entry["kind"]
+                    self.source = self.source or entry["source"]
+                else:
+                    self.completed.setdefault(entry["row"], {})[entry["step"]] = entry.get("data")
+
+    def _torn_tail(self):
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if not f.tell():
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def steps(self, row):
+        return self.completed.get(row, {})
+
+    def is_done(self, row, *steps):
+        done = self.steps(row)
+        return all(step in done for step in steps)
+
+    def record(self, row, step, data=None):
+        self.completed.setdefault(row, {})[step] = data
+        self._write({"row": row, "step": step, "data": data,
+                     "at": datetime.datetime.now().isoformat(timespec="seconds")})
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,113 @@
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+
+FINISHED = ("done", "failed")
+
+# === Job ===
+class Job:
+    def __init__(self, kind, label, func, args):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.label = label
+        self.func = func
+        self.args = args
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.total = None
+        self.results = []
+        self.error = None
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def set_total(self, total):
+        self._update(total=total)
+
+    def add_result(self, result):
+        with self._changed:
+            self.results.append(result)
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def snapshot(self, since=0):
+        with self._changed:
+            succeeded = sum(1 for result in self.results if result.get("success"))
+            end = self.finished or time.time()
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "label": self.label,
+                "status": self.status,
+                "created": self.created,
+                "queued_seconds": round((self.started or end) - self.created, 3),
+                "elapsed_seconds": round(end - self.started, 3) if self.started else 0,
+                "total": self.total,
+                "completed": len(self.results),
+                "succeeded": succeeded,
+                "failed": len(self.results) - succeeded,
+                "error": self.error,
+                "results": self.results[since:]
+            }
+
+# === Queue ===
+# Dashboard routes enqueue work here and return straight away; a few worker
+# threads drain the queue so Flask request threads are never tied up. Jobs
+# given a lane skip those workers and run on the shared scheduler instead, so
+# an offboard is not stuck behind a bulk upload that holds every job worker.
+class JobQueue:
+    def __init__(self, workers=2, keep_finished=200, scheduler=None):
+        self.keep_finished = keep_finished
+        self.scheduler = scheduler
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        for n in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True).start()
+
+    def submit(self, kind, label, func, *args, lane=None):
+        job = Job(kind, label, func, args)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        if lane and self.scheduler:
+            self.scheduler.submit(lane, self._run, job)
+        else:
+            self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            self._run(self._queue.get())
+
+    def _run(self, job):
+        job._update(status="running", started=time.time())
+        try:
+            job.func(job, *job.args)
+            job._update(status="done", finished=time.time())
+        except Exception as e:
+            job._update(status="failed", error=str(e), finished=time.time())
@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from csv_ingest import PLATFORMS
+from metrics import observe, register
+import providers
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Platforms a lock-out covers unless the caller names them.
+LOCKOUT_PLATFORMS = list(CONFIG.get("lockout_platforms", PLATFORMS))
+CLEANUP_WORKERS = int(os.getenv("CLEANUP_MAX_WORKERS") or CONFIG.get("cleanup_max_workers", 8))
+
+# Deferred cleanup runs here. Executor threads are joined when the interpreter
+# exits, before the mail queue and notifier flush, so a CLI run still finishes
+# its cleanup and sends what that queued.
+cleanup_executor = ThreadPoolExecutor(max_workers=CLEANUP_WORKERS, thread_name_prefix="cleanup")
+
+_lock = threading.Lock()
+_pending = set()
+_stats = {"locked_out": 0, "lockout_failed": 0, "cleaned_up": 0, "cleanup_failed": 0}
+
+def offboard_record(upn, platforms=None):
+    return {"upn": upn, "username": upn.split("@")[0], "platforms": list(platforms or LOCKOUT_PLATFORMS)}
+
+# === Two-phase offboarding ===
+def lock_out_user(upn, platforms=None):
+    # Phase 1 runs every platform's lock-out at once (Azure: disable and
+    # revokeSignInSessions; Google: suspend) and returns as soon as they are
+    # done. Phase 2 (licenses, groups, emails, notifications) is queued for the
+    # platforms that locked out. Returns (outcomes, cleanup future or None).
+    user = offboard_record(upn, platforms)
+    started = time.monotonic()
+    outcomes = providers.run_all("lock_out", user)
+    elapsed = time.monotonic() - started
+    locked = [name for name, outcome in outcomes.items() if outcome["success"]]
+    observe("time_to_lockout", elapsed, None if len(locked) == len(outcomes) else "failed")
+
+    with _lock:
+        _stats["locked_out" if len(locked) == len(outcomes) else "lockout_failed"] += 1
+    for name, outcome in outcomes.items():
+        if outcome["success"]:
+            print(f"🔒 {upn} locked out of {name} in {outcome['seconds']:.2f}s")
+        else:
+            print(f"❌ Lock-out of {upn} on {name} failed: {outcome['error']}")
+    return outcomes, defer_clean_up(user, locked) if locked else None
+
+def defer_clean_up(user, platforms):
+    future = cleanup_executor.submit(contextvars.copy_context().run, providers.run_all, "clean_up", user, platforms)
+    with _lock:
+        _pending.add(future)
+    future.add_done_callback(_cleaned_up)
+    return future
+
+def _cleaned_up(future):
+    failed = future.exception() is not None or not all(outcome["success"] for outcome in future.result().values())
+    with _lock:
+        _pending.discard(future)
+        _stats["cleanup_failed" if failed else "cleaned_up"] += 1
+
+def flush():
+    # Blocks until every cleanup queued so far has finished.
+    with _lock:
+        pending = list(_pending)
+    for future in pending:
+        future.exception()
+
+def stats():
+    with _lock:
+        return dict(_stats, cleanup_pending=len(_pending))
+
+register("lockout", stats, counters=_stats)
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import sqlite3
+import datetime
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+LOG_DIR = os.path.join(BASE_DIR, "logs")
+ACTIVE_SEGMENT = "automation.jsonl"
+INDEX_FILE = "automation.index.sqlite"
+# tail() pages on "<segment>:<offset>", query() on an entry id.
+TAIL_CURSOR = re.compile(r"^automation(-[\d-]+)?\.jsonl:\d+$")
+QUERY_CURSOR = re.compile(r"^\d+$")
+# The active file is rotated to automation-<timestamp>.jsonl once it reaches this size.
+MAX_BYTES = int(os.getenv("LOG_MAX_BYTES") or CONFIG.get("log_max_bytes", 10 * 1024 * 1024))
+BLOCK_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    action TEXT,
+    upn TEXT,
+    status TEXT,
+    duration REAL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_upn ON entries (upn, id);
+CREATE INDEX IF NOT EXISTS entries_status ON entries (status, id);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts, id);
+"""
+
+# === Reverse reader ===
+def read_reverse(path, end=None):
+    # Yields (offset, line) from the end of the file backwards, a block at a
+    # time, so the newest lines cost the same however large the file is.
+    with open(path, "rb") as f:
+        position = f.seek(0, 2) if end is None else end
+        buffer = b""
+        while position > 0:
+            size = min(BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            buffer = f.read(size) + buffer
+            lines = buffer.split(b"\n")
+            # The first piece may be the tail of a line that starts in an earlier block.
+            buffer = lines.pop(0)
+            line_end = position + len(buffer) + 1 + sum(len(line) + 1 for line in lines)
+            for line in reversed(lines):
+                line_end -= len(line) + 1
+                if line.strip():
+                    yield line_end, line
+        if buffer.strip():
+            yield 0, buffer
+
+def valid_cursor(cursor, filtered):
+    return bool((QUERY_CURSOR if filtered else TAIL_CURSOR).match(cursor))
+
+def parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+# === Store ===
+class LogStore:
+    def __init__(self, log_dir=LOG_DIR, max_bytes=MAX_BYTES):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _path(self, segment):
+        return os.path.join(self.log_dir, segment)
+
+    def segments(self):
+        # Oldest first; rotated names sort by their timestamp.
+        if not os.path.isdir(self.log_dir):
+            return []
+        rotated = sorted(name for name in os.listdir(self.log_dir)
+                         if name.startswith("automation-") and name.endswith(".jsonl"))
+        if os.path.exists(self._path(ACTIVE_SEGMENT)):
+            rotated.append(ACTIVE_SEGMENT)
+        return rotated
+
+    def _index(self):
+        # Opened on first use; a missing index is rebuilt from the segments.
+        if self._db is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            path = self._path(INDEX_FILE)
+            fresh = not os.path.exists(path)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+            if fresh:
+                self._rebuild()
+        return self._db
+
+    def _rebuild(self):
+        self._db.execute("BEGIN")
+        for segment in self.segments():
+            offset = 0
+            with open(self._path(segment), "rb") as f:
+                for line in f:
+                    record = parse_line(line)
+                    if record:
+                        self._insert(record, segment, offset)
+                    offset += len(line)
+        self._db.execute("COMMIT")
+
+    def _insert(self, record, segment, offset):
+        self._db.execute(
+            "INSERT INTO entries (ts, action, upn, status, duration, segment, offset) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (record.get("ts"), record.get("action"), (record.get("upn") or "").lower() or None,
+             record.get("status"), record.get("duration"), segment, offset))
+
+    def _rotate(self):
+        active = self._path(ACTIVE_SEGMENT)
+        if not os.path.exists(active) or os.path.getsize(active) < self.max_bytes:
+            return
+        segment = f"automation-{datetime.datetime.now():%Y%m%d-%H%M%S-%f}.jsonl"
+        os.rename(active, self._path(segment))
+        self._db.execute("UPDATE entries SET segment = ? WHERE segment = ?", (segment, ACTIVE_SEGMENT))
+
+    def write(self, action, status, upn=None, duration=None, **fields):
+        record = {
+            "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+            "action": action,
+            "upn": upn,
+            "status": status,
+            "duration": round(duration, 3) if duration is not None else None,
+            **fields
+        }
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._index()
+            self._rotate()
+            # The CLI and the dashboard append to the same file, so the offset is
+            # read after the write: one unbuffered O_APPEND write lands whole, and
+            # the position it leaves is the end of this line whatever the other
+            # process wrote before it.
+            with open(self._path(ACTIVE_SEGMENT), "ab", buffering=0) as f:
+                f.write(line)
+                offset = f.tell() - len(line)
+            self._insert(record, ACTIVE_SEGMENT, offset)
+        return record
+
+    def tail(self, limit=100, cursor=None):
+        # Newest first. cursor is "<segment>:<offset>" from a previous page and
+        # resumes just before that line. Returns (records, next_cursor).
+        segments = self.segments()
+        end = None
+        if cursor:
+            segment, _, offset = cursor.rpartition(":")
+            if segment not in segments:
+                return [], None
+            segments = segments[:segments.index(segment) + 1]
+            end = int(offset)
+
+        records = []
+        for segment in reversed(segments):
+            for offset, line in read_reverse(self._path(segment), end):
+                record = parse_line(line)
+                if record is None:
+                    continue
+                if len(records) == limit:
+                    return records, f"{segment}:{end_of(offset, line)}"
+                records.append(record)
+            end = None
+        return records, None
+
+    def query(self, upn=None, status=None, since=None, until=None, before=None, limit=100):
+        # Filtered pages come from the index, newest first, keyed on the entry
+        # id so every page is a bounded index range scan. since/until are
+        # inclusive ISO dates. Returns (records, next_cursor).
+        clauses, params = [], []
+        if upn:
+            clauses.append("upn = ?")
+            params.append(upn.lower())
+        if status:
+            clauses.append("status = ?")
+            params.append(status.upper())
+        if since:
+            clauses.append("ts >= ?")
+            params.append(datetime.date.fromisoformat(since).isoformat())
+        if until:
+            clauses.append("ts < ?")
+            params.append((datetime.date.fromisoformat(until) + datetime.timedelta(days=1)).isoformat())
+        if before:
+            clauses.append("id < ?")
+            params.append(int(before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            rows = self._index().execute(
+                f"SELECT id, segment, offset FROM entries {where} ORDER BY id DESC LIMIT ?",
+                params + [limit + 1]).fetchall()
+
+        records = []
+        for _, segment, offset in rows[:limit]:
+            record = self._read_at(segment, offset)
+            if record:
+                records.append(record)
+        return records, str(rows[limit - 1][0]) if len(rows) > limit else None
+
+    def _read_at(self, segment, offset):
+        try:
+            with open(self._path(segment), "rb") as f:
+                f.seek(offset)
+                return parse_line(f.readline())
+        except FileNotFoundError:
+            return None
+
+def end_of(offset, line):
+    # Cursor position that makes read_reverse start with this line.
+    return offset + len(line) + 1
+
+store = LogStore()
+
+def log_event(action, status, upn=None, duration=None, **fields):
+    return store.write(action, status, upn=upn, duration=duration, **fields)
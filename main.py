@@ -1,29 +1,35 @@
 import os
-import subprocess
+import time
+import importlib.util
 import argparse
-import datetime
 from colorama import init, Fore
+from log_store import log_event
 
 # Init colorama for Windows
 init(autoreset=True)
 
-LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
+def log_action(action, status, duration=None, error=None):
+    log_event(action, status, duration=duration, error=error)
 
-def log_action(action, status):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    entry = f"[{timestamp}] {action}: {status}\n"
-    with open(os.path.join(LOG_DIR, "automation.log"), "a") as log_file:
-        log_file.write(entry)
+# Menu and --bulk commands run in this process. Each module is imported on
+# first use, so a command only pays for the modules it actually needs.
+COMMANDS = {
+    "1": "azure_onboard",
+    "2": "azure_offboard",
+    "3": "google_onboard",
+    "4": "google_offboard"
+}
 
-def run_script(script_name):
+def run_command(module_name, *args):
+    script_name = f"{module_name}.py"
+    started = time.monotonic()
     try:
         print(Fore.YELLOW + f"▶ Running {script_name}...\n")
-        subprocess.run(["python", script_name], check=True)
-        log_action(script_name, "SUCCESS")
+        importlib.import_module(module_name).main(*args)
+        log_action(script_name, "SUCCESS", time.monotonic() - started)
         print(Fore.GREEN + f"✅ {script_name} completed.\n")
-    except subprocess.CalledProcessError as e:
-        log_action(script_name, f"ERROR: {e}")
+    except (Exception, SystemExit) as e:
+        log_action(script_name, "ERROR", time.monotonic() - started, str(e))
         print(Fore.RED + f"❌ {script_name} failed. Check logs.\n")
 
 def menu():
@@ -37,16 +43,17 @@ def menu():
 
 def handle_cli_args():
     parser = argparse.ArgumentParser(description="Employee Automation CLI")
-    parser.add_argument("--bulk", choices=["onboard", "offboard", "google_onboard", "google_offboard"],
+    parser.add_argument("--bulk", choices=["onboard", "offboard", "sync", "tenants", "google_onboard", "google_offboard"],
                         help="Run bulk operation via CSV")
     return parser.parse_args()
 
 def bulk_handler(mode):
-    script = f"bulk_{mode}.py"
-    if os.path.exists(script):
-        run_script(script)
+    module_name = f"bulk_{mode}"
+    if importlib.util.find_spec(module_name):
+        # Empty argv: the bulk module must not re-parse main.py's own arguments.
+        run_command(module_name, [])
     else:
-        print(Fore.RED + f"⚠️ Bulk script {script} not found.")
+        print(Fore.RED + f"⚠️ Bulk script {module_name}.py not found.")
 
 if __name__ == "__main__":
     args = handle_cli_args()
@@ -60,14 +67,8 @@ if __name__ == "__main__":
         clear()
         choice = menu()
 
-        if choice == "1":
-            run_script("azure_onboard.py")
-        elif choice == "2":
-            run_script("azure_offboard.py")
-        elif choice == "3":
-            run_script("google_onboard.py")
-        elif choice == "4":
-            run_script("google_offboard.py")
+        if choice in COMMANDS:
+            run_command(COMMANDS[choice])
         elif choice == "5":
             print(Fore.BLUE + "👋 Exiting. Goodbye.")
             break
@@ -0,0 +1,153 @@
+import time
+import inspect
+import functools
+import threading
+
+# Latency bucket upper bounds in seconds, Prometheus-style.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PREFIX = "zerotouch"
+
+_lock = threading.Lock()
+_steps = {}
+_sources = {}
+
+# === Recording ===
+def new_step():
+    return {"buckets": [0] * (len(BUCKETS) + 1), "count": 0, "sum": 0.0, "errors": {}}
+
+def observe(step, seconds, error=None):
+    with _lock:
+        data = _steps.setdefault(step, new_step())
+        data["count"] += 1
+        data["sum"] += seconds
+        data["buckets"][next((n for n, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))] += 1
+        if error is not None:
+            data["errors"][error] = data["errors"].get(error, 0) + 1
+
+def error_code(error):
+    # HTTP status where there is one (httpx, requests, googleapiclient), else the exception type.
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+    return str(status) if status else type(error).__name__
+
+def timed(step):
+    # Decorator for sync and async functions: records latency and, on failure,
+    # the error code before re-raising.
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.monotonic()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    observe(step, time.monotonic() - started, error_code(e))
+                    raise
+                observe(step, time.monotonic() - started)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                observe(step, time.monotonic() - started, error_code(e))
+                raise
+            observe(step, time.monotonic() - started)
+            return result
+        return wrapper
+    return decorate
+
+def register(name, stats, counters=()):
+    # stats() returns a flat dict; its numeric values are exported as
+    # <prefix>_<name>_<key>. Keys in counters only ever grow and are exported
+    # as counters with a _total suffix; everything else is a gauge.
+    _sources[name] = (stats, frozenset(counters))
+
+# === Reading ===
+def snapshot():
+    with _lock:
+        return {step: {"buckets": list(data["buckets"]), "count": data["count"], "sum": data["sum"],
+                       "errors": dict(data["errors"])} for step, data in _steps.items()}
+
+def percentile(buckets, count, fraction):
+    # Upper bound of the bucket holding the given fraction of calls.
+    seen = 0
+    for bound, bucket in zip(BUCKETS + (float("inf"),), buckets):
+        seen += bucket
+        if seen >= fraction * count:
+            return bound
+    return float("inf")
+
+def summary(since=None):
+    # Per-step totals; with since (an earlier snapshot()), only what happened after it.
+    since = since or {}
+    rows = []
+    for step, data in sorted(snapshot().items()):
+        before = since.get(step, new_step())
+        buckets = [now - then for now, then in zip(data["buckets"], before["buckets"])]
+        count = data["count"] - before["count"]
+        if not count:
+            continue
+        errors = {code: n - before["errors"].get(code, 0) for code, n in data["errors"].items()}
+        errors = {code: n for code, n in errors.items() if n}
+        rows.append({
+            "step": step,
+            "calls": count,
+            "errors": sum(errors.values()),
+            "error_codes": errors,
+            "avg_ms": round((data["sum"] - before["sum"]) / count * 1000, 1),
+            "p50_ms": percentile(buckets, count, 0.5) * 1000,
+            "p95_ms": percentile(buckets, count, 0.95) * 1000
+        })
+    return rows
+
+def print_summary(since=None):
+    rows = summary(since)
+    if not rows:
+        return
+    print("⏱️ Step timings:")
+    for row in rows:
+        codes = ", ".join(f"{code}×{n}" for code, n in row["error_codes"].items())
+        print(f"   {row['step']:<24} {row['calls']:>6} calls  avg {row['avg_ms']:>8.1f} ms  "
+              f"p50 ≤{row['p50_ms']:g} ms  p95 ≤{row['p95_ms']:g} ms"
+              + (f"  errors {row['errors']} ({codes})" if row["errors"] else ""))
+
+# === Prometheus exposition ===
+def label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus():
+    lines = [
+        f"# HELP {PREFIX}_step_duration_seconds Latency of each provisioning step.",
+        f"# TYPE {PREFIX}_step_duration_seconds histogram"
+    ]
+    steps = snapshot()
+    for step, data in sorted(steps.items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ("+Inf",), data["buckets"]):
+            cumulative += bucket
+            lines.append(f'{PREFIX}_step_duration_seconds_bucket{{step="{label(step)}",le="{bound}"}} {cumulative}')
+        lines.append(f'{PREFIX}_step_duration_seconds_sum{{step="{label(step)}"}} {data["sum"]:.6f}')
+        lines.append(f'{PREFIX}_step_duration_seconds_count{{step="{label(step)}"}} {data["count"]}')
+
+    lines += [
+        f"# HELP {PREFIX}_step_errors_total Failed steps by error code.",
+        f"# TYPE {PREFIX}_step_errors_total counter"
+    ]
+    for step, data in sorted(steps.items()):
+        for code, count in sorted(data["errors"].items()):
+            lines.append(f'{PREFIX}_step_errors_total{{step="{label(step)}",code="{label(code)}"}} {count}')
+
+    for name, (stats, counters) in sorted(_sources.items()):
+        for key, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                if key in counters:
+                    metric = f"{PREFIX}_{name}_{key}_total"
+                    lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+                else:
+                    metric = f"{PREFIX}_{name}_{key}"
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return "\n".join(lines) + "\n"
@@ -1,19 +1,195 @@
 import os
-import requests
+import json
+import time
+import queue
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from metrics import timed, register
+
+load_dotenv()
 
 SLACK_WEBHOOK = os.getenv("SLACK_WEBHOOK")
 TEAMS_WEBHOOK = os.getenv("TEAMS_WEBHOOK")
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# A hung webhook must never hold up provisioning: every post has a deadline.
+TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT") or CONFIG.get("notify_timeout", 5))
+# While a bulk run is coalescing, its messages go out as one digest per N
+# messages or N seconds, whichever comes first. Slack webhooks allow about 1 msg/sec.
+DIGEST_SIZE = int(CONFIG.get("notify_digest_size", 25))
+DIGEST_SECONDS = float(CONFIG.get("notify_digest_seconds", 10))
+
+# === Delivery ===
+_session_lock = threading.Lock()
+_session = None
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def post_webhook(url, message):
+    response = get_session().post(url, json={"text": message}, timeout=TIMEOUT)
+    response.raise_for_status()
+
+@timed("notify_slack")
 def notify_slack(message):
     if SLACK_WEBHOOK:
-        data = { "text": message }
-        requests.post(SLACK_WEBHOOK, json=data)
+        post_webhook(SLACK_WEBHOOK, message)
 
+@timed("notify_teams")
 def notify_teams(message):
     if TEAMS_WEBHOOK:
-        data = { "text": message }
-        requests.post(TEAMS_WEBHOOK, json=data)
+        post_webhook(TEAMS_WEBHOOK, message)
+
+# Only configured webhooks are sinks, so unset ones cost nothing and aren't timed.
+SINKS = {name: sink for name, sink, url in (("Slack", notify_slack, SLACK_WEBHOOK),
+                                            ("Teams", notify_teams, TEAMS_WEBHOOK)) if url}
+
+# The digest of the run that is sending, if any. A context variable, so only
+# messages sent on behalf of that run (its rows, on whichever worker thread)
+# are coalesced; a lock-out notice sent meanwhile goes out straight away.
+_current_digest = contextvars.ContextVar("notify_digest", default=None)
+
+# === Dispatcher ===
+# notify_all only enqueues. One background thread drains the queue and posts
+# each message to every sink at once, so a slow sink costs at most TIMEOUT.
+class Dispatcher:
+    def __init__(self, sinks, digest_size=DIGEST_SIZE, digest_seconds=DIGEST_SECONDS):
+        self.sinks = sinks
+        self.digest_size = digest_size
+        self.digest_seconds = digest_seconds
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        # {digest key: (messages, due time)}, one per coalescing run.
+        self._digests = {}
+
+    def send(self, message, digest=None):
+        self._start()
+        # Decided at send time, so a run's messages still in the queue when it
+        # finishes are part of its digest.
+        digest = digest or _current_digest.get()
+        self._queue.put(("digest", (digest, message)) if digest else ("message", message))
+
+    @contextmanager
+    def coalescing(self):
+        # Yields the run's digest key; messages sent in this context, or with
+        # the key passed explicitly, are merged into that run's digests.
+        digest = object()
+        token = _current_digest.set(digest)
+        try:
+            yield digest
+        finally:
+            _current_digest.reset(token)
+            self._start()
+            self._queue.put(("end", digest))
+
+    def flush(self, block=True):
+        # Sends any pending digest; with block, waits until everything
+        # queued so far has been delivered (or failed).
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        if block:
+            done.wait()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(("stop", None))
+        self._thread.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="notifier", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _work(self):
+        while True:
+            due = min((due for _, due in self._digests.values()), default=None)
+            timeout = max(0, due - time.monotonic()) if due else None
+            try:
+                kind, item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                now = time.monotonic()
+                for digest in [digest for digest, (_, due) in self._digests.items() if due <= now]:
+                    self._send_digest(digest)
+                continue
+
+            if kind == "message":
+                self._deliver(item)
+            elif kind == "digest":
+                digest, message = item
+                messages, _ = self._digests.setdefault(digest, ([], time.monotonic() + self.digest_seconds))
+                messages.append(message)
+                if len(messages) >= self.digest_size:
+                    self._send_digest(digest)
+            elif kind == "end":
+                self._send_digest(item)
+            else:
+                for digest in list(self._digests):
+                    self._send_digest(digest)
+                if item:
+                    item.set()
+                if kind == "stop":
+                    return
+
+    def _send_digest(self, digest):
+        messages, _ = self._digests.pop(digest, ([], None))
+        if len(messages) == 1:
+            self._deliver(messages[0])
+        elif messages:
+            self._deliver(f"📋 {len(messages)} updates:\n" + "\n".join(f"• {message}" for message in messages))
+
+    @timed("notify_all")
+    def _deliver(self, message):
+        # Plain threads rather than an executor: executors refuse new work once
+        # the interpreter starts shutting down, which is when close() drains.
+        threads = [threading.Thread(target=self._post, args=(name, sink, message), name=f"notify-{name}")
+                   for name, sink in self.sinks.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _post(self, name, sink, message):
+        try:
+            sink(message)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"⚠️ {name} notification failed: {e}")
+            return
+        with self._lock:
+            self.sent += 1
+
+dispatcher = Dispatcher(SINKS)
+register("notify", lambda: {"sent": dispatcher.sent, "failed": dispatcher.failed}, counters=("sent", "failed"))
+
+def notify_all(message, digest=None):
+    dispatcher.send(message, digest)
+
+def coalescing():
+    return dispatcher.coalescing()
 
-def notify_all(message):
-    notify_slack(message)
-    notify_teams(message)
+def flush():
+    dispatcher.flush()
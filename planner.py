@@ -0,0 +1,161 @@
+import os
+import json
+import asyncio
+from urllib.parse import quote
+from graph_client import MEMBER_OF_PARAMS, run, list_all
+from graph_batch import batch_request, run_batch, is_success, error_message
+from directory_cache import user_ids, forget_user
+from metrics import timed
+from tenants import setting
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Graph accepts at most 15 values in one "in" filter.
+FILTER_IN_LIMIT = 15
+USER_FIELDS = "id,userPrincipalName,displayName,accountEnabled,assignedLicenses"
+MEMBER_OF_PATH = "/users/{}/memberOf/microsoft.graph.group"
+
+# === Reads ===
+def odata_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def users_request(request_id, upns):
+    expression = f"userPrincipalName in ({','.join(odata_string(upn) for upn in upns)})"
+    return batch_request(request_id, "GET",
+                         f"/users?$filter={quote(expression)}&$select={USER_FIELDS}&$top={FILTER_IN_LIMIT}")
+
+def member_of_request(user_id):
+    return batch_request(user_id, "GET", f"{MEMBER_OF_PATH.format(user_id)}?$select=id&$top=999")
+
+@timed("plan_read_users")
+def read_users(upns):
+    # One filtered list query per 15 UPNs, 20 queries per $batch round-trip.
+    # Returns ({upn (lower case): user} for the users that already exist,
+    # {upn (lower case): error} for the UPNs whose query failed).
+    chunks = [upns[start:start + FILTER_IN_LIMIT] for start in range(0, len(upns), FILTER_IN_LIMIT)]
+    responses = run_batch([[users_request(str(n), chunk)] for n, chunk in enumerate(chunks)])
+    found, failed = {}, {}
+    for n, chunk in enumerate(chunks):
+        response = responses.get(str(n))
+        if not is_success(response):
+            failed.update((upn.lower(), error_message(response)) for upn in chunk)
+            continue
+        for user in response["body"].get("value", []):
+            found[user["userPrincipalName"].lower()] = user
+            user_ids.set(user["userPrincipalName"], user["id"])
+    return found, failed
+
+@timed("plan_read_groups")
+def read_memberships(ids, groups):
+    # Direct group memberships of just these users, one memberOf read each and
+    # 20 per $batch round-trip; the rare user with more than 999 groups has the
+    # rest paged in. Returns ({user id: configured groups they are in},
+    # {user id: error}).
+    responses = run_batch([[member_of_request(user_id)] for user_id in ids])
+    wanted = set(groups)
+    joined, failed, more = {}, {}, []
+    for user_id in ids:
+        response = responses.get(user_id)
+        if not is_success(response):
+            failed[user_id] = error_message(response)
+        elif response["body"].get("@odata.nextLink"):
+            more.append(user_id)
+        else:
+            joined[user_id] = wanted.intersection(group["id"] for group in response["body"].get("value", []))
+
+    async def load():
+        return await asyncio.gather(*(list_all(MEMBER_OF_PATH.format(user_id), MEMBER_OF_PARAMS) for user_id in more),
+                                    return_exceptions=True)
+    for user_id, result in zip(more, run(load()) if more else []):
+        if isinstance(result, Exception):
+            failed[user_id] = str(result)
+        else:
+            joined[user_id] = wanted.intersection(group["id"] for group in result)
+    return joined, failed
+
+# === Planning ===
+# A plan is the smallest set of writes that brings one user to the desired
+# state: created, enabled, licensed and a member of every configured group.
+# With rename=True an existing user's display name is also brought in line
+# with the row.
+class Planner:
+    def __init__(self, groups=None, sku_id=None, rename=False):
+        self.groups = list(setting("groups") if groups is None else groups)
+        self.sku_id = sku_id or setting("license_sku_id")
+        self.rename = rename
+        # user id -> configured groups the user is in, for the chunk in hand.
+        self._joined = {}
+
+    def read(self, ids):
+        # Reads memberships for the ids not already known; returns {user id: error}.
+        unknown = [user_id for user_id in dict.fromkeys(ids) if user_id not in self._joined]
+        if not unknown or not self.groups:
+            self._joined.update((user_id, set()) for user_id in unknown)
+            return {}
+        joined, failed = read_memberships(unknown, self.groups)
+        self._joined.update(joined)
+        return failed
+
+    def created(self, user_id):
+        # A user this run just created is in no groups yet.
+        self._joined[user_id] = set()
+
+    def missing_groups(self, user_id):
+        joined = self._joined.get(user_id, set())
+        return [group_id for group_id in self.groups if group_id not in joined]
+
+    def joined(self, group_id, user_id):
+        self._joined.setdefault(user_id, set()).add(group_id)
+        forget_user(user_id=user_id)
+
+    def done(self, ids):
+        # Drops finished users so memory stays flat across a large run.
+        for user_id in ids:
+            self._joined.pop(user_id, None)
+
+    def plan(self, users):
+        # Returns ({line: plan}, {line: error}) for a chunk of parsed rows. Rows
+        # whose current state could not be read get an error and no plan.
+        found, failed = read_users([user["upn"] for user in users]) if users else ({}, {})
+        unreadable = self.read([user["id"] for user in found.values()])
+        plans, errors = {}, {}
+        for user in users:
+            upn = user["upn"].lower()
+            current = found.get(upn)
+            if upn in failed:
+                errors[user["line"]] = f"read user: {failed[upn]}"
+            elif current is None:
+                plans[user["line"]] = {"id": None, "create": True, "enable": False, "license": True,
+                                       "rename": False, "groups": list(self.groups)}
+            elif current["id"] in unreadable:
+                errors[user["line"]] = f"read groups: {unreadable[current['id']]}"
+            else:
+                licensed = any(item.get("skuId") == self.sku_id for item in current.get("assignedLicenses", []))
+                plans[user["line"]] = {"id": current["id"], "create": False,
+                                       "enable": current.get("accountEnabled") is False,
+                                       "license": not licensed,
+                                       "rename": self.rename and current.get("displayName") != user["name"],
+                                       "groups": self.missing_groups(current["id"])}
+        return plans, errors
+
+def is_empty(plan):
+    return not (plan["create"] or plan["enable"] or plan["license"] or plan["rename"] or plan["groups"])
+
+def describe(plan):
+    actions = [action for action in ("create", "enable", "license", "rename") if plan[action]]
+    if plan["groups"]:
+        actions.append(f"groups {', '.join(plan['groups'])}")
+    return "; ".join(actions) or "in sync"
+
+def totals(plans):
+    plans = list(plans)
+    return {
+        "create": sum(1 for plan in plans if plan["create"]),
+        "enable": sum(1 for plan in plans if plan["enable"]),
+        "license": sum(1 for plan in plans if plan["license"]),
+        "group_adds": sum(len(plan["groups"]) for plan in plans),
+        "in_sync": sum(1 for plan in plans if is_empty(plan))
+    }
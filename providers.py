@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import contextvars
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from log_store import log_event
+from metrics import timed
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Platforms other than a user's first run here, so the bulk pool's row workers
+# never wait on their own pool.
+MAX_WORKERS = int(os.getenv("PROVIDER_MAX_WORKERS") or CONFIG.get("provider_max_workers", 16))
+
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="provider")
+
+# === Interface ===
+# One provider per directory platform. Every step blocks and raises on failure.
+# create returns the key the other onboarding steps take (the Graph object id,
+# the Google primary email); offboarding steps take the account's address.
+# Platform modules are imported on first use so a missing Google credential
+# does not break Azure rows.
+class Provider(ABC):
+    name = None
+
+    @abstractmethod
+    def address(self, user):
+        ...
+
+    @abstractmethod
+    def create(self, user):
+        ...
+
+    @abstractmethod
+    def add_groups(self, key):
+        ...
+
+    @abstractmethod
+    def assign_license(self, key):
+        ...
+
+    @abstractmethod
+    def get_manager(self, address):
+        ...
+
+    @abstractmethod
+    def disable(self, address):
+        ...
+
+    @abstractmethod
+    def remove_groups(self, address):
+        ...
+
+    def onboard(self, user):
+        key = self.create(user)
+        self.add_groups(key)
+        self.assign_license(key)
+        return key
+
+    def offboard(self, user):
+        self.lock_out(user)
+        self.clean_up(user)
+
+    def lock_out(self, user):
+        # The part of offboarding that has to be fast: no more access.
+        self.disable(self.address(user))
+
+    def clean_up(self, user):
+        # Everything else, safe to run later.
+        self.remove_groups(self.address(user))
+
+# === Azure AD ===
+class AzureProvider(Provider):
+    name = "azure"
+
+    def address(self, user):
+        return user["upn"]
+
+    def create(self, user):
+        from azure_onboard import create_user
+        return create_user(user["name"], user["upn"], user["mail_nickname"])
+
+    def add_groups(self, user_id):
+        from azure_onboard import add_user_to_groups
+        add_user_to_groups(user_id)
+
+    def assign_license(self, user_id):
+        from azure_onboard import assign_license
+        assign_license(user_id)
+
+    def get_manager(self, upn):
+        from azure_onboard import get_user_manager
+        return get_user_manager(upn)
+
+    def disable(self, upn):
+        from azure_offboard import disable_user
+        disable_user(upn)
+
+    def remove_groups(self, upn):
+        from graph_client import run
+        from azure_offboard import remove_user_from_groups_async
+        run(remove_user_from_groups_async(upn))
+
+    def onboard(self, user):
+        # Groups, license and the manager lookup overlap on the Graph client,
+        # then the welcome and manager emails are queued.
+        from azure_onboard import onboard_user
+        return onboard_user(user["name"], user["username"], user["domain"])
+
+    def offboard(self, user):
+        from azure_offboard import offboard_user
+        offboard_user(self.address(user))
+
+    def lock_out(self, user):
+        # Disable and session revocation go out together.
+        from azure_offboard import lock_out
+        lock_out(self.address(user))
+
+    def clean_up(self, user):
+        from azure_offboard import clean_up_user
+        clean_up_user(self.address(user))
+
+# === Google Workspace ===
+class GoogleProvider(Provider):
+    name = "google"
+
+    def address(self, user):
+        # Google accounts live in google_domain whatever the row's own domain is.
+        return f"{user['username']}@{CONFIG['google_domain']}"
+
+    def create(self, user):
+        from google_onboard import user_body
+        from google_directory import get_service, execute
+        return execute(get_service().users().insert(body=user_body(user["name"], user["username"])))["primaryEmail"]
+
+    @timed("add_google_groups")
+    def add_groups(self, email):
+        from google_directory import get_service
+        service = get_service()
+        run_batch_or_raise([
+            (group, service.members().insert(groupKey=group, body={"email": email, "role": "MEMBER"}))
+            for group in CONFIG.get("google_groups", [])
+        ])
+
+    def assign_license(self, email):
+        # Nothing to do: Workspace licenses follow the org unit's automatic
+        # assignment, so there is no per-user call to make.
+        return None
+
+    @timed("get_google_manager")
+    def get_manager(self, email):
+        from google_directory import get_service, execute
+        user = execute(get_service().users().get(userKey=email, fields="relations"))
+        return next((relation["value"] for relation in user.get("relations", [])
+                     if relation.get("type") == "manager"), None)
+
+    def disable(self, email):
+        from google_offboard import suspend_google_user
+        suspend_google_user(email, notify=False)
+
+    @timed("remove_google_groups")
+    def remove_groups(self, email):
+        from google_directory import get_service, execute
+        service = get_service()
+        groups, page_token = [], None
+        while True:
+            page = execute(service.groups().list(userKey=email, pageToken=page_token, fields="groups(email),nextPageToken"))
+            groups += [group["email"] for group in page.get("groups", [])]
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                break
+        run_batch_or_raise([(group, service.members().delete(groupKey=group, memberKey=email)) for group in groups])
+
+    def onboard(self, user):
+        from google_onboard import create_google_user
+        email = create_google_user(user["name"], user["username"])
+        self.add_groups(email)
+        return email
+
+    def offboard(self, user):
+        from google_offboard import suspend_google_user
+        email = self.address(user)
+        suspend_google_user(email)
+        self.remove_groups(email)
+
+    def clean_up(self, user):
+        from notifier import notify_all
+        email = self.address(user)
+        self.remove_groups(email)
+        notify_all(f"⚠️ GWS user offboarded: *{email}*")
+
+def run_batch_or_raise(requests):
+    # One Directory batch round-trip; any failed call fails the step.
+    from google_directory import run_batch, error_message
+    errors = []
+
+    def on_result(request_id, response, error):
+        if error:
+            errors.append(f"{request_id}: {error_message(error)}")
+
+    if requests:
+        run_batch(requests, on_result)
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+PROVIDERS = {provider.name: provider for provider in (AzureProvider(), GoogleProvider())}
+
+# === Running ===
+def run_action(provider, action, user):
+    started = time.monotonic()
+    outcome = {"success": False}
+    try:
+        getattr(provider, action)(user)
+        outcome["success"] = True
+    except Exception as e:
+        outcome["error"] = str(e)
+    outcome["seconds"] = round(time.monotonic() - started, 3)
+    log_event(f"{action}_{provider.name}", "SUCCESS" if outcome["success"] else "ERROR", upn=provider.address(user),
+              duration=outcome["seconds"], error=outcome.get("error"))
+    return outcome
+
+def run_all(action, user, platforms=None):
+    # Runs provider.<action>(user) for every platform at once: the first on the
+    # calling thread, the rest on the provider pool, so a user takes as long as
+    # their slowest platform rather than the sum of them. Returns
+    # {platform: {"success", "seconds", "error"}} in the order given.
+    platforms = platforms or user["platforms"]
+    # Each platform runs in a copy of the caller's context (digests, tenant).
+    futures = {name: executor.submit(contextvars.copy_context().run, run_action, PROVIDERS[name], action, user)
+               for name in platforms[1:]}
+    outcomes = {platforms[0]: run_action(PROVIDERS[platforms[0]], action, user)}
+    for name, future in futures.items():
+        outcomes[name] = future.result()
+    return outcomes
+
+def onboard(user, platforms=None):
+    return run_all("onboard", user, platforms)
+
+def offboard(user, platforms=None):
+    return run_all("offboard", user, platforms)
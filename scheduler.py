@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from metrics import observe, register
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Share of picks each lane gets while all of them have work, highest first.
+LANE_WEIGHTS = {"offboard": 16, "manual": 4, "bulk": 1}
+MAX_WORKERS = int(os.getenv("BULK_MAX_WORKERS") or CONFIG.get("bulk_max_workers", 8))
+# A task that has waited this long runs next whatever its lane, so a steady
+# stream of urgent work cannot starve bulk rows.
+MAX_WAIT = float(CONFIG.get("scheduler_max_wait_seconds", 30))
+# Workers kept free of bulk rows, so an offboard never waits behind a full pool.
+RESERVED_WORKERS = int(CONFIG.get("scheduler_reserved_workers", 1))
+
+class Task:
+    __slots__ = ("lane", "func", "args", "kwargs", "context", "future", "enqueued")
+
+    def __init__(self, lane, func, args, kwargs):
+        self.lane = lane
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        # Runs in the submitter's context, so the run's notification and mail
+        # digests and its tenant follow each row onto the worker.
+        self.context = contextvars.copy_context()
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+# === Scheduler ===
+# One pool for every provisioning task in the process. Each task is one unit
+# of work (an offboard, a manual onboard, a single bulk row), so a bulk run
+# yields to urgent work at every row boundary. Lanes are picked by smooth
+# weighted round-robin; a lane with nothing queued banks no credit.
+class Scheduler:
+    def __init__(self, workers=MAX_WORKERS, weights=LANE_WEIGHTS, max_wait=MAX_WAIT, reserved=RESERVED_WORKERS):
+        self.workers = workers
+        self.weights = dict(weights)
+        self.max_wait = max_wait
+        # The lowest-weight lane is the one kept off the reserved workers.
+        self.bulk_lane = min(self.weights, key=self.weights.get)
+        self.bulk_limit = max(1, workers - reserved)
+        self._cond = threading.Condition()
+        self._queues = {lane: deque() for lane in self.weights}
+        self._credit = {lane: 0 for lane in self.weights}
+        self._running = {lane: 0 for lane in self.weights}
+        self._stats = {lane: {"submitted": 0, "completed": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+                       for lane in self.weights}
+        self._threads = []
+
+    def submit(self, lane, func, *args, **kwargs):
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane '{lane}'")
+        task = Task(lane, func, args, kwargs)
+        with self._cond:
+            self._start()
+            self._queues[lane].append(task)
+            self._stats[lane]["submitted"] += 1
+            self._cond.notify()
+        return task.future
+
+    def map(self, lane, func, items):
+        futures = [self.submit(lane, func, item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        # Flat, for the metrics registry: <lane>_queued, <lane>_avg_wait_seconds, ...
+        now = time.monotonic()
+        flat = {}
+        with self._cond:
+            for lane, data in self._stats.items():
+                queue = self._queues[lane]
+                flat[f"{lane}_queued"] = len(queue)
+                flat[f"{lane}_running"] = self._running[lane]
+                flat[f"{lane}_completed"] = data["completed"]
+                flat[f"{lane}_oldest_wait_seconds"] = round(now - queue[0].enqueued, 3) if queue else 0.0
+                flat[f"{lane}_avg_wait_seconds"] = round(data["wait_seconds"] / data["completed"], 3) if data["completed"] else 0.0
+                flat[f"{lane}_max_wait_seconds"] = round(data["max_wait_seconds"], 3)
+        return flat
+
+    def _start(self):
+        # Called with the lock held; threads start on first use.
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"scheduler-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _eligible(self):
+        return [lane for lane, queue in self._queues.items()
+                if queue and (lane != self.bulk_lane or self._running[lane] < self.bulk_limit)]
+
+    def _pick(self):
+        # Called with the lock held; returns a Task or None.
+        lanes = self._eligible()
+        if not lanes:
+            return None
+        now = time.monotonic()
+        starving = [lane for lane in lanes if now - self._queues[lane][0].enqueued >= self.max_wait]
+        if starving:
+            lane = min(starving, key=lambda lane: self._queues[lane][0].enqueued)
+        else:
+            for name in self._credit:
+                if name in lanes:
+                    self._credit[name] += self.weights[name]
+                else:
+                    self._credit[name] = 0
+            lane = max(lanes, key=lambda lane: self._credit[lane])
+            self._credit[lane] -= sum(self.weights[name] for name in lanes)
+        self._running[lane] += 1
+        return self._queues[lane].popleft()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._pick()
+                while task is None:
+                    self._cond.wait()
+                    task = self._pick()
+            wait = time.monotonic() - task.enqueued
+            observe(f"queue_wait_{task.lane}", wait)
+            if task.future.set_running_or_notify_cancel():
+                try:
+                    task.future.set_result(task.context.run(task.func, *task.args, **task.kwargs))
+                except Exception as e:
+                    task.future.set_exception(e)
+            with self._cond:
+                self._running[task.lane] -= 1
+                data = self._stats[task.lane]
+                data["completed"] += 1
+                data["wait_seconds"] += wait
+                data["max_wait_seconds"] = max(data["max_wait_seconds"], wait)
+                # A finished bulk row may unblock a bulk task another worker skipped.
+                self._cond.notify()
+
+scheduler = Scheduler()
+register("scheduler", scheduler.stats, counters={f"{lane}_completed" for lane in scheduler.weights})
+
+def submit(lane, func, *args, **kwargs):
+    return scheduler.submit(lane, func, *args, **kwargs)
@@ -0,0 +1,89 @@
+import os
+import json
+import contextlib
+import contextvars
+from dotenv import load_dotenv
+from graph_auth import TENANT_ID, CLIENT_ID, CLIENT_SECRET, TOKEN_CACHE_FILE, TokenProvider, provider
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+with open(os.path.join(BASE_DIR, "config.json")) as f:
+    CONFIG = json.load(f)
+
+# Keys of a profile that describe the tenant itself; everything else in it
+# overrides the top-level config.json value of the same name (groups,
+# license_sku_id, default_password, graph_max_concurrency, ...).
+PROFILE_KEYS = {"tenant_id", "client_id", "client_secret_env", "domains", "token_cache"}
+
+# === Tenants ===
+# One Azure tenant: its own app credentials and token, its own settings, and,
+# in graph_client, its own connection pool and throttle window.
+class Tenant:
+    def __init__(self, name, tenant_id, token_provider, domains=(), settings=None):
+        self.name = name
+        self.tenant_id = tenant_id
+        self.provider = token_provider
+        self.domains = [domain.lower() for domain in domains]
+        self.overrides = dict(settings or {})
+        self.settings = dict(CONFIG, **self.overrides)
+
+    def setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+def token_cache_file(name, profile):
+    # Each tenant gets its own MSAL cache file; several providers writing one
+    # file would overwrite each other's tokens.
+    if "token_cache" in profile:
+        return profile["token_cache"]
+    if TOKEN_CACHE_FILE:
+        root, ext = os.path.splitext(TOKEN_CACHE_FILE)
+        return f"{root}.{name}{ext}"
+    return None
+
+def load_profile(name, profile):
+    # Secrets stay in the environment: client_secret_env names the variable.
+    client_id = profile.get("client_id", CLIENT_ID)
+    client_secret = os.getenv(profile["client_secret_env"]) if "client_secret_env" in profile else CLIENT_SECRET
+    token_provider = TokenProvider(profile["tenant_id"], client_id, client_secret, token_cache_file(name, profile))
+    settings = {key: value for key, value in profile.items() if key not in PROFILE_KEYS}
+    return Tenant(name, profile["tenant_id"], token_provider, profile.get("domains", []), settings)
+
+# The tenant from .env, as used before profiles existed. Domains no profile
+# claims belong to it.
+DEFAULT = Tenant("default", TENANT_ID, provider)
+TENANTS = {name: load_profile(name, profile) for name, profile in CONFIG.get("tenants", {}).items()}
+DOMAINS = {domain: tenant for tenant in TENANTS.values() for domain in tenant.domains}
+
+def get(name):
+    if name == DEFAULT.name:
+        return DEFAULT
+    if name not in TENANTS:
+        raise ValueError(f"Unknown tenant '{name}'")
+    return TENANTS[name]
+
+def for_domain(domain):
+    return DOMAINS.get(domain.lower(), DEFAULT)
+
+def for_upn(upn):
+    return for_domain(upn.rsplit("@", 1)[-1])
+
+# === Current tenant ===
+# A context variable rather than a global, so shards on different threads each
+# see their own tenant. Graph coroutines started from a thread inherit it.
+_current = contextvars.ContextVar("tenant", default=None)
+
+def current():
+    return _current.get() or DEFAULT
+
+@contextlib.contextmanager
+def use(tenant):
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+def setting(key, default=None):
+    return current().setting(key, default)
@@ -0,0 +1,82 @@
+import os
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+
+# === Retry policy ===
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", 6))
+BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.5))
+MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 60))
+# Methods that are safe to send twice. Anything else (creates, sendMail,
+# revokeSignInSessions, $batch envelopes with writes) may already have been
+# applied when a 5xx or a dropped connection comes back, so it is only resent
+# when the server said it did not process it: 429 or 503.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+def is_idempotent(method):
+    return method.upper() in IDEMPOTENT_METHODS
+
+def should_retry(status, idempotent):
+    return status in (RETRY_STATUSES if idempotent else THROTTLE_STATUSES)
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    # The server's Retry-After wins; otherwise exponential backoff with full jitter.
+    delay = parse_retry_after(retry_after)
+    if delay is not None:
+        return min(delay, MAX_DELAY)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+# === Adaptive concurrency ===
+class AdaptiveLimiter:
+    # AIMD: halve the window when throttled, grow it by one after a full
+    # window of successes. Used from a single event loop, so no thread locks.
+    def __init__(self, max_limit, min_limit=1, cooldown=1.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self):
+        # One burst of 429s from in-flight calls counts as a single signal.
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit // 2)
+        self._successes = 0